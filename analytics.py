@@ -0,0 +1,80 @@
+"""勉強ログの集計 (分析タブ用)。
+
+日別×科目の合計を一度だけ groupby し、そこから週・月・四半期・年のロールアップ、
+連続日数、直近1年のヒートマップ、目標達成率を作る。結果は app.get_analytics() が
+ログの版数をキーにメモ化するため、ログが変わらない限り再計算しない。
+グラフには生の行ではなく、表示期間に応じて ビン数 MAX_BINS 以下に束ねたデータを渡す。
+"""
+from datetime import timedelta
+
+import pandas as pd
+
+# 表示期間 -> 日数 (None は全期間)
+RANGES = {"1週間": 7, "1ヶ月": 31, "3ヶ月": 92, "1年": 365, "全期間": None}
+# 細かい順。表示期間のビン数が MAX_BINS 以下になる最初の粒度を使う
+FREQS = [("D", "日", 1), ("W-SAT", "週", 7), ("M", "月", 30.4), ("Q", "四半期", 91.3), ("Y", "年", 365.25)]
+MAX_BINS = 62
+HEATMAP_DAYS = 365
+GOAL_RATE_DAYS = 30
+WEEKDAYS = ["日", "月", "火", "水", "木", "金", "土"]
+
+
+def _rollup(daily, freq):
+    period = daily['study_date'].dt.to_period(freq).dt.start_time
+    out = daily.groupby([period, 'subject'], observed=True)['minutes'].sum().reset_index()
+    return out[out['minutes'] > 0]
+
+
+def _streaks(totals, today):
+    """(現在の連続日数, 最長連続日数)。今日がまだ0分でも昨日まで続いていれば途切れていない扱い。"""
+    days = totals.index[totals > 0]
+    if days.empty: return 0, 0
+    runs = pd.Series(days).diff().dt.days.ne(1).cumsum()
+    lengths = runs.groupby(runs).size()
+    last = days[-1].date()
+    current = int(lengths.iloc[-1]) if last >= today - timedelta(days=1) else 0
+    return current, int(lengths.max())
+
+
+def _heatmap(totals, today):
+    start = pd.Timestamp(today - timedelta(days=HEATMAP_DAYS - 1))
+    days = pd.date_range(start, pd.Timestamp(today))
+    minutes = totals.reindex(days, fill_value=0)
+    first_sunday = start - pd.Timedelta(days=(start.dayofweek + 1) % 7)
+    return pd.DataFrame({
+        'date': days,
+        'week': ((days - first_sunday).days // 7).astype('int16'),
+        'weekday': pd.Categorical([WEEKDAYS[(d + 1) % 7] for d in days.dayofweek], categories=WEEKDAYS),
+        'minutes': minutes.to_numpy(),
+    })
+
+
+def compute(logs, daily_goal, today):
+    """log_frame() 形式のログから分析タブの集計をまとめて作る。"""
+    daily = (logs.groupby(['study_date', 'subject'], observed=True)['duration_minutes'].sum()
+             .rename('minutes').reset_index())
+    totals = daily.groupby('study_date')['minutes'].sum().sort_index()
+    recent = totals.reindex(pd.date_range(pd.Timestamp(today - timedelta(days=GOAL_RATE_DAYS - 1)), pd.Timestamp(today)), fill_value=0)
+    current, longest = _streaks(totals, today)
+    return {
+        "total_minutes": int(totals.sum()),
+        "active_days": int((totals > 0).sum()),
+        "first_day": totals.index[0].date() if not totals.empty else today,
+        "streak": current,
+        "longest_streak": longest,
+        "goal_rate": float((recent >= max(1, daily_goal)).mean()),
+        "by_subject": daily.groupby('subject', observed=True)['minutes'].sum().sort_values(ascending=False),
+        "rollups": {freq: (daily if freq == "D" else _rollup(daily, freq)) for freq, _, _ in FREQS},
+        "heatmap": _heatmap(totals, today),
+    }
+
+
+def chart_data(stats, range_label, today):
+    """表示期間に合わせて粒度を選び、(ビン済みデータ, 粒度名) を返す。"""
+    days = RANGES[range_label]
+    if days is None: days = max(1, (today - stats["first_day"]).days + 1)
+    freq, label, _ = next((f for f in FREQS if days / f[2] <= MAX_BINS), FREQS[-1])
+    start = pd.Timestamp(today - timedelta(days=days - 1))
+    if freq != "D": start = start.to_period(freq).start_time
+    frame = stats["rollups"][freq]
+    return frame[frame['study_date'] >= start], label
@@ -1,756 +1,1591 @@
-import streamlit as st
-from supabase import create_client, Client
-import pandas as pd
-import time
-import calendar
-from datetime import datetime, date, timedelta, timezone
-import altair as alt
-import io
-import base64
-from PIL import Image
-import hashlib
-import random
-import extra_streamlit_components as stx
-
-# --- ページ設定 ---
-st.set_page_config(page_title="褒めてくれる勉強時間・タスク管理アプリ", layout="wide", initial_sidebar_state="expanded")
-
-# --- 日本時間 (JST) の定義 ---
-JST = timezone(timedelta(hours=9))
-
-# --- Supabase接続設定 ---
-@st.cache_resource
-def init_supabase():
-    try:
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
-    except:
-        return None
-
-supabase = init_supabase()
-
-# --- Cookieマネージャー ---
-cookie_manager = stx.CookieManager(key="cookie_manager")
-
-# --- デザイン適用関数 (カレンダー色固定版) ---
-def apply_design(user_theme="標準", wallpaper="真っ白", main_text_color="#000000", accent_color="#FFD700"):
-    fonts = {
-        "ピクセル風": "'DotGothic16', sans-serif",
-        "手書き風": "'Yomogi', cursive",
-        "ポップ": "'Hachi Maru Pop', cursive",
-        "明朝体": "'Shippori Mincho', serif",
-        "筆文字": "'Yuji Syuku', serif",
-        "標準": "sans-serif"
-    }
-    font_family = fonts.get(user_theme, "sans-serif")
-    
-    # 壁紙CSS
-    bg_css = "background-color: #ffffff;"
-    sidebar_bg = "#f8f9fa"
-    container_bg = "#ffffff"
-    text_color = main_text_color
-    
-    if wallpaper == "真っ黒":
-        bg_css = "background-color: #121212;"
-        sidebar_bg = "#1e1e1e"
-        container_bg = "#2d2d2d"
-        text_color = "#ffffff"
-    elif wallpaper == "夕焼け":
-        bg_css = "background-image: linear-gradient(120deg, #f6d365 0%, #fda085 100%);"
-        container_bg = "rgba(255, 255, 255, 0.9)"
-    elif wallpaper == "夜空":
-        bg_css = "background-image: linear-gradient(to top, #30cfd0 0%, #330867 100%);"
-        sidebar_bg = "rgba(0, 0, 0, 0.6)"
-        container_bg = "rgba(255, 255, 255, 0.95)"
-    elif wallpaper == "草原":
-        bg_css = "background-image: linear-gradient(120deg, #d4fc79 0%, #96e6a1 100%);"
-        container_bg = "rgba(255, 255, 255, 0.9)"
-
-    # ★カレンダー・ボタン用の固定色定義
-    fixed_cal_bg = "#ffffff"       # ボタン背景：白固定
-    fixed_cal_text = "#333333"     # ボタン文字：黒固定
-    fixed_cal_border = "#e0e0e0"   # ボタン枠線：グレー固定
-    fixed_cal_select = "#FFD700"   # 選択時：ゴールド固定（アクセントカラーに依存しない）
-    fixed_cal_hover = "#fffdf0"    # ホバー時：薄いクリーム色固定
-
-    st.markdown(f"""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=DotGothic16&family=Yomogi&family=Hachi+Maru+Pop&family=Shippori+Mincho&family=Yuji+Syuku&display=swap');
-    
-    /* 1. ベースフォント設定 */
-    html, body, [data-testid="stAppViewContainer"] {{
-        font-family: {font_family}, sans-serif;
-        {bg_css}
-    }}
-    
-    /* 2. テキスト要素への適用 */
-    h1, h2, h3, h4, h5, h6, p, label, li, a, .stMarkdown, .stText {{
-        font-family: {font_family}, sans-serif !important;
-        color: {text_color} !important;
-    }}
-    
-    /* 3. 入力フォームとボタンのフォント */
-    input, textarea, select, button, .stButton button, .stSelectbox div {{
-        font-family: {font_family}, sans-serif !important;
-    }}
-
-    /* サイドバー */
-    [data-testid="stSidebar"] {{ 
-        background-color: {sidebar_bg} !important; 
-        border-right: 1px solid rgba(128,128,128,0.2); 
-    }}
-    [data-testid="stSidebar"] * {{ 
-        color: {main_text_color} !important; 
-    }}
-
-    /* 入力フォームの背景色固定 (白) */
-    input, textarea, select {{
-        background-color: #ffffff !important; 
-        color: #000000 !important; 
-        border: 1px solid #ccc !important;
-    }}
-    div[data-baseweb="select"] > div {{ 
-        background-color: #ffffff !important; 
-        color: #000000 !important; 
-    }}
-
-    /* ★カレンダーの日付ボタン (色を完全固定) */
-    .stButton button {{
-        width: 100%; 
-        height: 70px; 
-        white-space: pre-wrap; 
-        line-height: 1.1; 
-        padding: 2px;
-        border: 1px solid {fixed_cal_border} !important; 
-        background-color: {fixed_cal_bg} !important; 
-        color: {fixed_cal_text} !important;
-        transition: all 0.2s; 
-        border-radius: 8px;
-    }}
-    .stButton button:hover {{
-        border-color: {fixed_cal_select} !important; 
-        background-color: {fixed_cal_hover} !important; 
-        transform: translateY(-2px); 
-        z-index: 10; 
-        position: relative;
-    }}
-    
-    /* ★選択中の日付ボタン (色を完全固定・primary上書き) */
-    div[data-testid="stVerticalBlock"] .stButton button[kind="primary"] {{
-        background-color: {fixed_cal_select} !important; 
-        border-color: #e6c200 !important; 
-        color: #000000 !important; /* 文字色は黒固定 */
-        font-weight: bold; 
-        border-width: 2px;
-    }}
-
-    /* コンテナ */
-    div[data-testid="stVerticalBlockBorderWrapper"], div[data-testid="stExpander"], div[data-testid="stForm"] {{
-        background-color: {container_bg} !important;
-        border: 1px solid rgba(128,128,128,0.2); border-radius: 12px; padding: 20px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-    }}
-    
-    /* ステータスバー */
-    .status-bar {{
-        background: {container_bg}; border: 1px solid rgba(128,128,128,0.2); 
-        padding: 15px; border-radius: 12px; display: flex; justify-content: space-around; align-items: center; margin-bottom: 20px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-    }}
-    .stat-val {{ font-size: 1.6em; font-weight: bold; }}
-    
-    /* 単位表示 (メイン文字色) */
-    .stat-unit {{
-        font-size: 0.6em;
-        font-weight: normal;
-        margin-left: 3px;
-        color: {main_text_color} !important;
-    }}
-    
-    /* アクションボタンも固定色（ゴールド）にする */
-    button[kind="primary"] {{
-        background: {fixed_cal_select} !important; 
-        border: none !important; 
-        color: #000 !important; 
-        font-weight: bold !important;
-    }}
-
-    /* ランキングデザイン */
-    .ranking-card {{
-        padding: 15px; margin-bottom: 12px; border-radius: 15px; 
-        display: flex; align-items: center; 
-        background: {container_bg};
-        border: 1px solid rgba(128,128,128,0.1);
-        transition: transform 0.2s;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.05);
-    }}
-    .ranking-card:hover {{ transform: scale(1.02); }}
-
-    .rank-1 {{ background: linear-gradient(135deg, #FFF8E1 0%, #FFD700 100%) !important; border: 2px solid #FFD700 !important; }}
-    .rank-1 .rank-name, .rank-1 .rank-score {{ color: #5c4d00 !important; text-shadow: 0 1px 0 rgba(255,255,255,0.6); }}
-    .rank-2 {{ background: linear-gradient(135deg, #F5F5F5 0%, #C0C0C0 100%) !important; border: 2px solid #C0C0C0 !important; }}
-    .rank-3 {{ background: linear-gradient(135deg, #FFF0E0 0%, #CD7F32 100%) !important; border: 2px solid #CD7F32 !important; }}
-    
-    .rank-medal {{ font-size: 2.5rem; width: 60px; text-align: center; margin-right: 10px; }}
-    .rank-info {{ flex-grow: 1; }}
-    .rank-name {{ font-size: 1.3em; font-weight: 800; color: {text_color}; }}
-    .rank-title {{ font-size: 0.8em; opacity: 0.8; color: {text_color}; }}
-    .rank-score {{ font-size: 1.5em; font-weight: 900; text-align: right; margin-right: 10px; color: {accent_color}; }}
-    </style>
-    """, unsafe_allow_html=True)
-
-# --- 認証・DB操作 ---
-def make_hashes(password): return hashlib.sha256(str.encode(password)).hexdigest()
-def check_hashes(password, hashed_text): return make_hashes(password) == hashed_text
-
-def login_user(username, password):
-    try:
-        res = supabase.table("users").select("password").eq("username", username).execute()
-        if res.data and check_hashes(password, res.data[0]["password"]): return True, "成功"
-        return False, "IDまたはパスワードが違います"
-    except: return False, "エラー"
-
-def add_user(username, password, nickname):
-    try:
-        data = {
-            "username": username, "password": make_hashes(password), "nickname": nickname, 
-            "xp": 0, "coins": 0, 
-            "unlocked_themes": "標準", "current_theme": "標準", 
-            "current_title": "見習い", "unlocked_titles": "見習い", 
-            "current_wallpaper": "真っ白", "unlocked_wallpapers": "真っ白",
-            "unlocked_bgms": "Lofi", "current_bgm": "なし", 
-            "daily_goal": 60, "main_text_color": "#000000", "accent_color": "#FFD700"
-        }
-        supabase.table("users").insert(data).execute()
-        return True, "登録成功"
-    except: return False, "エラー"
-
-def get_user_data(username):
-    try:
-        res = supabase.table("users").select("*").eq("username", username).execute()
-        return res.data[0] if res.data else None
-    except: return None
-
-def get_subjects(username):
-    try:
-        res = supabase.table("subjects").select("subject_name").eq("username", username).execute()
-        return [r['subject_name'] for r in res.data]
-    except: return []
-
-def add_subject_db(u, s): supabase.table("subjects").insert({"username": u, "subject_name": s}).execute()
-def delete_subject_db(u, s): supabase.table("subjects").delete().eq("username", u).eq("subject_name", s).execute()
-
-def add_study_log(u, s, m, d):
-    supabase.table("study_logs").insert({"username": u, "subject": s, "duration_minutes": m, "study_date": str(d)}).execute()
-    ud = get_user_data(u)
-    if not ud: return m, 0, 0, False
-    
-    today_str = str(date.today())
-    last_reward = ud.get('last_goal_reward_date')
-    goal = ud.get('daily_goal', 60)
-    
-    logs = supabase.table("study_logs").select("duration_minutes").eq("username", u).eq("study_date", today_str).execute()
-    total = sum([l['duration_minutes'] for l in logs.data]) if logs.data else m
-    
-    goal_reached = False
-    
-    if last_reward != today_str and total >= goal:
-        new_xp = ud['xp'] + m
-        new_coins = ud['coins'] + m + 100
-        supabase.table("users").update({
-            "xp": new_xp, "coins": new_coins, "last_goal_reward_date": today_str
-        }).eq("username", u).execute()
-        goal_reached = True
-    else:
-        new_xp = ud['xp'] + m
-        new_coins = ud['coins'] + m
-        supabase.table("users").update({"xp": new_xp, "coins": new_coins}).eq("username", u).execute()
-        
-    return m, new_xp, new_coins, goal_reached
-
-def delete_study_log(lid, u, m):
-    supabase.table("study_logs").delete().eq("id", lid).execute()
-    ud = get_user_data(u)
-    if ud: supabase.table("users").update({"xp": max(0, ud['xp']-m), "coins": max(0, ud['coins']-m)}).eq("username", u).execute()
-
-def get_study_logs(u):
-    try:
-        res = supabase.table("study_logs").select("*").eq("username", u).order("created_at", desc=True).execute()
-        if res.data: return pd.DataFrame(res.data)
-        else: return pd.DataFrame(columns=['id', 'username', 'subject', 'duration_minutes', 'study_date'])
-    except: return pd.DataFrame(columns=['id', 'username', 'subject', 'duration_minutes', 'study_date'])
-
-def get_tasks(u):
-    try:
-        res = supabase.table("tasks").select("*").eq("username", u).order("due_date").execute()
-        if res.data: return pd.DataFrame(res.data)
-        else: return pd.DataFrame(columns=['id', 'username', 'task_name', 'status', 'due_date', 'priority'])
-    except: return pd.DataFrame(columns=['id', 'username', 'task_name', 'status', 'due_date', 'priority'])
-
-def add_task(u, n, d, p): supabase.table("tasks").insert({"username": u, "task_name": n, "status": "未完了", "due_date": str(d), "priority": p}).execute()
-def delete_task(tid): supabase.table("tasks").delete().eq("id", tid).execute()
-def complete_task(tid, u):
-    supabase.table("tasks").update({"status": "完了"}).eq("id", tid).execute()
-    ud = get_user_data(u)
-    if ud: supabase.table("users").update({"xp": ud['xp']+10, "coins": ud['coins']+10}).eq("username", u).execute()
-
-def get_weekly_ranking():
-    start = (datetime.now(JST) - timedelta(days=7)).strftime('%Y-%m-%d')
-    try:
-        logs = supabase.table("study_logs").select("username, duration_minutes").gte("study_date", start).execute()
-        if not logs.data: return pd.DataFrame()
-        df = pd.DataFrame(logs.data).groupby('username').sum().reset_index()
-        users = supabase.table("users").select("username, nickname, current_title").execute()
-        return pd.merge(df, pd.DataFrame(users.data), on='username', how='left').sort_values('duration_minutes', ascending=False)
-    except: return pd.DataFrame()
-
-# --- タイマー ---
-@st.fragment(run_every=1)
-def show_timer_fragment(user_name):
-    is_paused = st.session_state.get("timer_paused", False)
-    accumulated = st.session_state.get("timer_accumulated", 0)
-    start_time = st.session_state.get("start_time", time.time())
-    
-    if is_paused:
-        elapsed = int(accumulated)
-    else:
-        elapsed = int(accumulated + (time.time() - start_time))
-    
-    h, m, s = elapsed // 3600, (elapsed % 3600) // 60, elapsed % 60
-    
-    st.markdown(f"""
-    <div style="text-align: center; font-size: 6em; font-weight: bold; margin-bottom: 20px;">
-        {h:02}:{m:02}:{s:02}
-    </div>
-    """, unsafe_allow_html=True)
-    
-    c1, c2 = st.columns(2)
-    with c1:
-        if not is_paused:
-            if st.button("⏸ 一時停止", use_container_width=True):
-                st.session_state["timer_accumulated"] = elapsed
-                st.session_state["timer_paused"] = True
-                st.rerun()
-        else:
-            if st.button("▶ 再開", use_container_width=True):
-                st.session_state["start_time"] = time.time()
-                st.session_state["timer_paused"] = False
-                st.rerun()
-                
-    with c2:
-        if st.button("⏹️ 終了", use_container_width=True, type="primary"):
-            duration = max(1, elapsed // 60)
-            _, _, _, reached = add_study_log(user_name, st.session_state.get("current_subject", "自習"), duration, date.today())
-            st.session_state["is_studying"] = False
-            st.session_state["timer_paused"] = False
-            st.session_state["timer_accumulated"] = 0
-            st.session_state["celebrate"] = True
-            st.session_state["toast_msg"] = f"{duration}分 記録しました！"
-            if reached: st.session_state["goal_reached_msg"] = "🎉 目標達成！"
-            st.rerun()
-
-# --- メイン処理 ---
-def main():
-    if "logged_in" not in st.session_state: 
-        st.session_state.update({
-            "logged_in": False, "username": "", "is_studying": False, 
-            "start_time": None, "celebrate": False, "toast_msg": None, 
-            "selected_date": str(date.today()),
-            "cal_year": date.today().year, "cal_month": date.today().month,
-            "selected_bgm": "なし",
-            "timer_paused": False, "timer_accumulated": 0
-        })
-
-    if not st.session_state["logged_in"]:
-        st.title("🛡️ ログイン")
-        mode = st.selectbox("モード", ["ログイン", "新規登録"])
-        u = st.text_input("ユーザーID"); p = st.text_input("パスワード", type="password")
-        if mode == "新規登録":
-            n = st.text_input("ニックネーム")
-            if st.button("登録"):
-                res, msg = add_user(u, p, n)
-                if res: st.success(msg)
-                else: st.error(msg)
-        else:
-            if st.button("ログイン"):
-                res, msg = login_user(u, p)
-                if res:
-                    cookie_manager.set('logtask_auth', f"{u}:{make_hashes(p)}", expires_at=datetime.now() + timedelta(days=7))
-                    st.session_state["logged_in"] = True; st.session_state["username"] = u; st.rerun()
-                else: st.error(msg)
-        return
-
-    user = get_user_data(st.session_state["username"])
-    if not user: st.session_state["logged_in"] = False; st.rerun()
-
-    if 'unlocked_bgms' not in user:
-        try: supabase.table("users").update({"unlocked_bgms": "Lofi"}).eq("username", user['username']).execute()
-        except: pass
-        user['unlocked_bgms'] = "Lofi"
-
-    if not user.get('current_wallpaper'):
-        try: supabase.table("users").update({"current_wallpaper": "真っ白"}).eq("username", user['username']).execute()
-        except: pass
-
-    today_str = str(date.today())
-    if user.get('last_login_date') != today_str:
-        new_coins = user['coins'] + 100
-        supabase.table("users").update({
-            "coins": new_coins,
-            "last_login_date": today_str
-        }).eq("username", user['username']).execute()
-        st.toast("🎁 ログインボーナス！ +100コイン GET！", icon="🎁")
-        time.sleep(1)
-        user['coins'] = new_coins
-
-    apply_design(
-        user.get('current_theme', '標準'), 
-        user.get('current_wallpaper', '真っ白'),
-        user.get('main_text_color', '#000000'),
-        user.get('accent_color', '#FFD700')
-    )
-
-    # サイドバー
-    with st.sidebar:
-        st.subheader("⚙️ 設定")
-        
-        st.markdown("##### 🎵 集中時のBGM (YouTube)")
-        my_bgms = ["なし"] + user.get('unlocked_bgms', 'Lofi').split(',')
-        if "Lofi" not in my_bgms: my_bgms.append("Lofi")
-        
-        selected_bgm = st.selectbox("再生する音", my_bgms, index=0, key="bgm_select")
-        st.session_state["selected_bgm"] = selected_bgm
-
-        with st.expander("👑 称号装備"):
-            my_titles = user.get('unlocked_titles', '見習い').split(',')
-            cur_t = user.get('current_title', '見習い')
-            new_title = st.selectbox("称号", my_titles, index=my_titles.index(cur_t) if cur_t in my_titles else 0)
-            if new_title != cur_t:
-                supabase.table("users").update({"current_title": new_title}).eq("username", user['username']).execute()
-                st.rerun()
-
-        with st.expander("🖼️ 壁紙"):
-            my_walls = user.get('unlocked_wallpapers', '真っ白').split(',')
-            cur_w = user.get('current_wallpaper', '真っ白')
-            new_w = st.selectbox("壁紙", my_walls, index=my_walls.index(cur_w) if cur_w in my_walls else 0)
-            if new_w != cur_w:
-                supabase.table("users").update({"current_wallpaper": new_w}).eq("username", user['username']).execute()
-                st.rerun()
-
-        with st.expander("🎨 文字色"):
-            cur_m = user.get('main_text_color', '#000000'); cur_a = user.get('accent_color', '#FFD700')
-            nm = st.color_picker("メイン", cur_m); na = st.color_picker("アクセント", cur_a)
-            if nm != cur_m or na != cur_a:
-                supabase.table("users").update({"main_text_color": nm, "accent_color": na}).eq("username", user['username']).execute()
-                st.rerun()
-        
-        st.divider()
-        ng = st.number_input("1日の目標(分)", value=user.get('daily_goal', 60), step=10)
-        if ng != user.get('daily_goal', 60):
-            if st.button("目標保存"):
-                supabase.table("users").update({"daily_goal": ng}).eq("username", user['username']).execute()
-                st.rerun()
-        
-        st.divider()
-        
-        VALID = ["標準", "ピクセル風", "手書き風", "ポップ", "明朝体", "筆文字"]
-        my_fonts = [t for t in user.get('unlocked_themes', '').split(',') if t in VALID]
-        if not my_fonts: my_fonts = ["標準"]
-        cur_font = user.get('current_theme', '標準')
-        if cur_font not in my_fonts: cur_font = "標準"
-        nt = st.selectbox("フォント", my_fonts, index=my_fonts.index(cur_font))
-        if nt != cur_font:
-            supabase.table("users").update({"current_theme": nt}).eq("username", user['username']).execute()
-            st.rerun()
-
-        if st.button("ログアウト"):
-            cookie_manager.delete('logtask_auth')
-            st.session_state["logged_in"] = False; st.rerun()
-
-    # ★ 集中モード (BGM再生)
-    if st.session_state["is_studying"]:
-        st.empty()
-        
-        if not st.session_state.get("timer_paused", False):
-            s_bgm = st.session_state.get("selected_bgm", "なし")
-            bgm_map = {
-                "Lofi": "https://www.youtube.com/watch?v=jfKfPfyJRdk",
-                "雨音": "https://www.youtube.com/watch?v=BSmYxnvUDHw",
-                "カフェ": "https://www.youtube.com/watch?v=rVUv_j9AiVM",
-                "森": "https://www.youtube.com/watch?v=eNUpTV9BGac",
-                "ホワイトノイズ": "https://www.youtube.com/watch?v=E1bbH03JhKA"
-            }
-            if s_bgm in bgm_map:
-                st.video(bgm_map[s_bgm], autoplay=True)
-                st.caption(f"🎵 再生中: {s_bgm}")
-        else:
-            st.warning("⏸ 一時停止中（BGM停止）")
-
-        st.markdown(f"<h1 style='text-align:center;'>🔥 {st.session_state.get('current_subject','')} 中...</h1>", unsafe_allow_html=True)
-        show_timer_fragment(user['username'])
-        return
-
-    logs_df = get_study_logs(user['username'])
-    tasks = get_tasks(user['username'])
-    today_mins = 0
-    if not logs_df.empty and 'duration_minutes' in logs_df.columns:
-        today_mins = logs_df[logs_df['study_date'].astype(str).str.contains(str(date.today()))]['duration_minutes'].sum()
-
-    st.markdown(f"""
-    <div class="status-bar">
-        <div class="stat-item"><div class="stat-label">PLAYER</div><div class="stat-val" style="font-size:1.2em;">{user['nickname']}</div><div style="font-size:0.7em;">{user.get('current_title', '見習い')}</div></div>
-        <div class="stat-item"><div class="stat-label">XP</div><div class="stat-val" style="color:{user.get('accent_color')};">{user['xp']}</div></div>
-        <div class="stat-item"><div class="stat-label">COIN</div><div class="stat-val" style="color:{user.get('accent_color')};">{user['coins']} <span class="stat-unit">G</span></div></div>
-        <div class="stat-item"><div class="stat-label">TODAY</div><div class="stat-val" style="color:{user.get('accent_color')};">{today_mins} <span class="stat-unit">/ {user.get('daily_goal')} min</span></div></div>
-    </div>
-    """, unsafe_allow_html=True)
-    st.progress(min(1.0, today_mins / max(1, user.get('daily_goal', 60))))
-
-    if st.session_state.get("celebrate"): st.balloons(); st.session_state["celebrate"] = False
-    if st.session_state.get("toast_msg"): st.toast(st.session_state["toast_msg"]); st.session_state["toast_msg"] = None
-
-    t1, t2, t3, t4, t5, t6 = st.tabs(["📅 カレンダー", "⏱️ タイマー", "📊 分析", "🏆 ランキング", "🛒 ショップ", "📚 科目"])
-
-    with t1: 
-        c1, c2 = st.columns([0.65, 0.35])
-        with c1:
-            with st.container(border=True):
-                # 月移動
-                mc1, mc2, mc3 = st.columns([0.2, 0.6, 0.2])
-                with mc1:
-                    if st.button("◀ 前月"):
-                        st.session_state.cal_month -= 1
-                        if st.session_state.cal_month == 0: st.session_state.cal_month = 12; st.session_state.cal_year -= 1
-                        st.rerun()
-                with mc2:
-                    st.markdown(f"<h3 style='text-align:center; margin:0; color:{user.get('main_text_color')};'>{st.session_state.cal_year}年 {st.session_state.cal_month}月</h3>", unsafe_allow_html=True)
-                with mc3:
-                    if st.button("次月 ▶"):
-                        st.session_state.cal_month += 1
-                        if st.session_state.cal_month == 13: st.session_state.cal_month = 1; st.session_state.cal_year += 1
-                        st.rerun()
-                
-                cols = st.columns(7)
-                weekdays = ["日", "月", "火", "水", "木", "金", "土"]
-                for i, w in enumerate(weekdays):
-                    cols[i].markdown(f"<div style='text-align:center; font-weight:bold; color:#666;'>{w}</div>", unsafe_allow_html=True)
-                
-                cal = calendar.Calendar(firstweekday=6)
-                month_days = cal.monthdayscalendar(st.session_state.cal_year, st.session_state.cal_month)
-                
-                for week in month_days:
-                    cols = st.columns(7)
-                    for i, d in enumerate(week):
-                        with cols[i]:
-                            if d != 0:
-                                d_str = f"{st.session_state.cal_year}-{st.session_state.cal_month:02}-{d:02}"
-                                label = f"{d}"
-                                if not logs_df.empty:
-                                    s_mins = logs_df[logs_df['study_date'].astype(str).str.contains(d_str)]['duration_minutes'].sum()
-                                    if s_mins > 0: label += f"\n📖{s_mins}分"
-                                if not tasks.empty:
-                                    t_cnt = len(tasks[(tasks['due_date'].astype(str) == d_str) & (tasks['status'] == '未完了')])
-                                    if t_cnt > 0: label += f"\n🔔{t_cnt}件"
-                                
-                                b_type = "primary" if d_str == st.session_state.get("selected_date") else "secondary"
-                                if st.button(label, key=f"btn_{d_str}", type=b_type, use_container_width=True):
-                                    st.session_state["selected_date"] = d_str
-                                    st.rerun()
-                            else: st.write("")
-
-        with c2:
-            with st.container(border=True):
-                raw_sel = st.session_state.get("selected_date", str(date.today()))
-                display_date = raw_sel
-                st.markdown(f"### 📌 {display_date}")
-                
-                st.write("📚 **勉強記録**")
-                if not logs_df.empty:
-                    day_logs = logs_df[logs_df['study_date'].astype(str).str.contains(display_date)]
-                    if not day_logs.empty:
-                        total_d = day_logs['duration_minutes'].sum()
-                        st.info(f"合計: {total_d}分")
-                        for _, r in day_logs.iterrows():
-                            lc1, lc2 = st.columns([0.7, 0.3])
-                            lc1.text(f"{r['subject']}: {r['duration_minutes']}分")
-                            if lc2.button("削除", key=f"deld_{r['id']}"):
-                                delete_study_log(r['id'], user['username'], r['duration_minutes'])
-                                st.rerun()
-                    else: st.caption("記録なし")
-                else: st.caption("記録なし")
-                
-                st.divider()
-                st.write("📝 **タスク**")
-                if not tasks.empty:
-                    dt = tasks[tasks['due_date'].astype(str) == display_date]
-                    if not dt.empty:
-                        for _, task in dt.iterrows():
-                            tc1, tc2, tc3 = st.columns([0.6, 0.2, 0.2])
-                            if task['status'] == "未完了":
-                                tc1.write(task['task_name'])
-                                if tc2.button("完", key=f"done_{task['id']}"):
-                                    complete_task(task['id'], user['username']); st.rerun()
-                                if tc3.button("消", key=f"delt_{task['id']}"):
-                                    delete_task(task['id']); st.rerun()
-                            else: tc1.write(f"✅ {task['task_name']}")
-                    else: st.caption("タスクなし")
-                
-                st.divider()
-                with st.form("add_t"):
-                    tn = st.text_input("タスク追加")
-                    try: dd = datetime.strptime(display_date, '%Y-%m-%d').date()
-                    except: dd = date.today()
-                    td = st.date_input("期日", value=dd)
-                    if st.form_submit_button("追加"):
-                        add_task(user['username'], tn, td, "中"); st.rerun()
-
-    with t2: 
-        c1, c2 = st.columns(2)
-        with c1:
-            st.subheader("🔥 集中")
-            sub = st.selectbox("科目", get_subjects(user['username']) + ["その他"])
-            if sub=="その他": sub = st.text_input("科目名")
-            if st.button("スタート", type="primary", use_container_width=True):
-                if sub:
-                    st.session_state["is_studying"]=True; st.session_state["start_time"]=time.time(); st.session_state["current_subject"]=sub
-                    st.session_state["timer_paused"]=False; st.session_state["timer_accumulated"]=0
-                    st.rerun()
-        with c2:
-            st.subheader("✏️ 記録")
-            with st.form("manual"):
-                d = st.date_input("日付"); h = st.number_input("時間",0,23); m = st.number_input("分",0,59)
-                s = st.text_input("科目", value=sub if sub!="その他" else "")
-                if st.form_submit_button("記録"):
-                    add_study_log(user['username'], s, h*60+m, d); st.rerun()
-        
-        st.write("履歴 (最新5件)")
-        if not logs_df.empty:
-            for _,r in logs_df.head(5).iterrows():
-                st.text(f"{r['study_date']} : {r['subject']} ({r['duration_minutes']}分)")
-
-    with t3: 
-        k1, k2 = st.columns(2)
-        k1.metric("総勉強時間", f"{logs_df['duration_minutes'].sum()//60}時間" if not logs_df.empty else "0時間")
-        k2.metric("今日", f"{today_mins}分")
-        if not logs_df.empty:
-            logs_df['dt'] = pd.to_datetime(logs_df['study_date'])
-            rc = logs_df[logs_df['dt'] >= (datetime.now(JST)-timedelta(days=7)).replace(tzinfo=None)]
-            if not rc.empty:
-                st.altair_chart(alt.Chart(rc).mark_bar().encode(x='dt:T', y='duration_minutes', color='subject'), use_container_width=True)
-                
-    with t4: 
-        st.subheader("🏆 週間ランキング")
-        rk = get_weekly_ranking()
-        if not rk.empty:
-            top_score = rk.iloc[0]['duration_minutes']
-            for i, r in rk.iterrows():
-                rank = i + 1
-                if rank == 1: css_class, medal = "rank-1", "🥇"
-                elif rank == 2: css_class, medal = "rank-2", "🥈"
-                elif rank == 3: css_class, medal = "rank-3", "🥉"
-                else: css_class, medal = "", f"<span style='font-size:1.5rem; font-weight:bold; color:#888;'>{rank}</span>"
-                
-                bar_width = (r['duration_minutes'] / top_score) * 100 if top_score > 0 else 0
-                st.markdown(f"""
-                <div class="ranking-card {css_class}">
-                    <div class="rank-medal">{medal}</div>
-                    <div class="rank-info">
-                        <div class="rank-name">{r['nickname']}</div>
-                        <div class="rank-title">👑 {r['current_title']}</div>
-                    </div>
-                    <div style="text-align:right;">
-                        <div class="rank-score">{int(r['duration_minutes'])} <span class="rank-unit">min</span></div>
-                        <div style="width:100px; height:6px; background:rgba(0,0,0,0.1); border-radius:3px; margin-left:auto;">
-                            <div style="width:{bar_width}%; height:100%; background:{user.get('accent_color')}; border-radius:3px;"></div>
-                        </div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-        else: st.info("データが集計されていません")
-
-    with t5: 
-        st.subheader("🛒 ショップ")
-        
-        c_bgm, c_other = st.columns(2)
-        
-        with c_bgm:
-            st.markdown("#### 🎵 BGM購入")
-            for b, p in [("雨音", 500), ("カフェ", 800), ("森", 800), ("ホワイトノイズ", 300)]:
-                with st.container(border=True):
-                    bc1, bc2 = st.columns([0.6, 0.4])
-                    bc1.write(f"**{b}**")
-                    bc1.caption(f"{p} G")
-                    if b not in user.get('unlocked_bgms', 'Lofi'):
-                        if bc2.button("購入", key=f"buy_bgm_{b}"):
-                            if user['coins'] >= p:
-                                try:
-                                    current_bgms = user.get('unlocked_bgms', 'Lofi')
-                                    new_bgms = current_bgms + "," + b
-                                    supabase.table("users").update({"coins": user['coins'] - p, "unlocked_bgms": new_bgms}).eq("username", user['username']).execute()
-                                    st.balloons(); st.rerun()
-                                except: st.error("購入に失敗しました")
-                            else: st.error("不足")
-                    else: bc2.write("✅ 済")
-
-        with c_other:
-            st.markdown("#### 🅰️ フォント")
-            for f, p in [("ピクセル風",500),("手書き風",800),("ポップ",1000),("明朝体",1200),("筆文字",1500)]:
-                with st.container(border=True):
-                    fc1, fc2 = st.columns([0.6,0.4])
-                    fc1.write(f"**{f}**")
-                    fc1.caption(f"{p} G")
-                    if f not in user['unlocked_themes']:
-                        if fc2.button("購入", key=f"buy_{f}"):
-                            if user['coins']>=p:
-                                supabase.table("users").update({"coins":user['coins']-p, "unlocked_themes":user['unlocked_themes']+","+f}).eq("username", user['username']).execute()
-                                st.balloons(); st.rerun()
-                            else: st.error("不足")
-                    else: fc2.write("✅ 済")
-            
-            st.divider()
-            
-            st.markdown("#### 🖼️ 壁紙")
-            for w, p in [("真っ黒",500),("夕焼け",800),("夜空",1000),("草原",1200)]:
-                with st.container(border=True):
-                    wc1, wc2 = st.columns([0.6,0.4])
-                    wc1.write(f"**{w}**")
-                    wc1.caption(f"{p} G")
-                    if w not in user['unlocked_wallpapers']:
-                        if wc2.button("購入", key=f"buy_w_{w}"):
-                            if user['coins']>=p:
-                                supabase.table("users").update({"coins":user['coins']-p, "unlocked_wallpapers":user['unlocked_wallpapers']+","+w}).eq("username", user['username']).execute()
-                                st.balloons(); st.rerun()
-                            else: st.error("不足")
-                    else: wc2.write("✅ 済")
-            
-            st.divider()
-            st.markdown("#### 🎲 称号ガチャ")
-            with st.container(border=True):
-                st.write("**ランダム称号ガチャ (1回 100 G)**")
-                if st.button("ガチャを回す", type="primary"):
-                    if user['coins'] >= 100:
-                        titles = ["駆け出し", "努力家", "集中王", "夜更かし", "天才", "覚醒者", "大賢者", "神童", "マスター", "レジェンド"]
-                        got = random.choice(titles)
-                        current_list = user['unlocked_titles'].split(',')
-                        if got not in current_list:
-                            new_list = user['unlocked_titles'] + "," + got
-                            supabase.table("users").update({"coins":user['coins']-100, "unlocked_titles":new_list}).eq("username", user['username']).execute()
-                            st.toast(f"🎉 新しい称号「{got}」を獲得！")
-                        else:
-                            supabase.table("users").update({"coins":user['coins']-100}).eq("username", user['username']).execute()
-                            st.toast(f"かぶり！「{got}」だった...")
-                        st.balloons(); time.sleep(1); st.rerun()
-                    else: st.error("コイン不足")
-
-    with t6: 
-        ns = st.text_input("新規科目")
-        if st.button("追加", key="add_sub"):
-            if ns: add_subject_db(user['username'], ns); st.rerun()
-        for s in get_subjects(user['username']):
-            c1, c2 = st.columns([0.8, 0.2])
-            c1.write(s)
-            if c2.button("削除", key=f"del_s_{s}"): delete_subject_db(user['username'], s); st.rerun()
-
-if __name__ == "__main__":
-    main()
+import time
+_SCRIPT_STARTED = time.perf_counter()  # 起動計測用 (import を含めた最初の描画までの時間)
+import streamlit as st
+from supabase import create_client, Client
+from postgrest.exceptions import APIError
+import httpx
+import calendar
+from datetime import datetime, date, timedelta, timezone
+import base64
+import hashlib
+import hmac
+import random
+import functools
+import os
+import re
+import sys
+import importlib
+import extra_streamlit_components as stx
+from streamlit_calendar import calendar as st_calendar
+import streamlit.components.v1 as components
+import threading
+import contextvars
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import profiler
+import data_io
+import outbox
+
+# --- 遅延 import (ログイン画面に不要な重いモジュールは、最初に使われた時点で読み込む) ---
+class _LazyModule:
+    def __init__(self, name): self._name = name
+    def __getattr__(self, attr): return getattr(importlib.import_module(self._name), attr)
+
+pd = _LazyModule("pandas")        # データを扱うビュー (ログイン後)
+alt = _LazyModule("altair")       # 分析タブのグラフ
+analytics = _LazyModule("analytics")
+HEAVY_MODULES = ("pandas", "altair", "analytics")
+_IMPORT_MS = round((time.perf_counter() - _SCRIPT_STARTED) * 1000, 1)
+
+@st.cache_resource
+def prewarm_modules():
+    """ログイン画面を出した後、入力を待つ間に裏で重いモジュールを読み込んでおく (プロセスごとに1回)。"""
+    def work():
+        for name in HEAVY_MODULES:
+            try: importlib.import_module(name)
+            except Exception: pass
+    threading.Thread(target=work, name="logtask-prewarm", daemon=True).start()
+    return True
+
+# --- ページ設定 ---
+st.set_page_config(page_title="褒めてくれる勉強時間・タスク管理アプリ", layout="wide", initial_sidebar_state="expanded")
+
+# --- 日本時間 (JST) の定義 ---
+JST = timezone(timedelta(hours=9))
+
+def jst_today():
+    """「今日」は常に日本時間で判定する (サーバーのタイムゾーンに依存させない)。"""
+    return datetime.now(JST).date()
+
+# --- Supabase接続設定 ---
+@st.cache_resource
+def init_supabase():
+    try:
+        url = st.secrets["supabase"]["url"]
+        key = st.secrets["supabase"]["key"]
+        return create_client(url, key)
+    except:
+        return None
+
+supabase = profiler.instrument(init_supabase())
+
+def profiling_enabled():
+    """?debug=1 でデバッグパネル付き、環境変数 LOGTASK_PROFILE=1 で全再実行のプロファイルをログに出す。"""
+    return st.query_params.get("debug") == "1" or os.environ.get("LOGTASK_PROFILE") == "1"
+
+# --- Cookieマネージャー ---
+# コンポーネントの描画を伴うため、Cookie を読み書きする再実行 (未ログイン時・ログイン直後・ログアウト) でだけ作る
+_cookie_manager = None
+
+def get_cookie_manager():
+    global _cookie_manager  # スクリプトは再実行ごとに読み直されるので、1回の再実行につき1つ
+    if _cookie_manager is None: _cookie_manager = stx.CookieManager(key="cookie_manager")
+    return _cookie_manager
+
+def write_auth_cookie():
+    """ログイン時に預けたトークンを Cookie に書く。set はコンポーネントを描画するだけなので、ブラウザが書き込み完了を返すまで毎回描画し続ける"""
+    pending = st.session_state.get("_auth_cookie")
+    if not pending: return
+    if st.session_state.get(pending["key"]): del st.session_state["_auth_cookie"]; return
+    get_cookie_manager().set(AUTH_COOKIE, pending["token"], key=pending["key"], expires_at=pending["expires_at"])
+
+# --- アイテム目録 (ショップ・ガチャ・所持判定はすべてここを参照する) ---
+# カテゴリ -> [(名前, 価格)]。並び順が users.<カテゴリ>_mask のビット位置になるため、追加は末尾のみ (削除・並べ替え不可)
+# 先頭は初期所持品 (マスクの初期値 1)。価格 None はショップで売らない (称号はガチャ専用)
+CATALOG = {
+    "themes": [("標準", 0), ("ピクセル風", 500), ("手書き風", 800), ("ポップ", 1000), ("明朝体", 1200), ("筆文字", 1500)],
+    "titles": [("見習い", 0)] + [(t, None) for t in ["駆け出し", "努力家", "集中王", "夜更かし", "天才", "覚醒者", "大賢者", "神童", "マスター", "レジェンド"]],
+    "wallpapers": [("真っ白", 0), ("真っ黒", 500), ("夕焼け", 800), ("夜空", 1000), ("草原", 1200)],
+    "bgms": [("Lofi", 0), ("雨音", 500), ("カフェ", 800), ("森", 800), ("ホワイトノイズ", 300)],
+}
+ITEM_BITS = {cat: {name: i for i, (name, _) in enumerate(items)} for cat, items in CATALOG.items()}
+GACHA_PRICE = 100
+BGM_URLS = {
+    "Lofi": "https://www.youtube.com/watch?v=jfKfPfyJRdk",
+    "雨音": "https://www.youtube.com/watch?v=BSmYxnvUDHw",
+    "カフェ": "https://www.youtube.com/watch?v=rVUv_j9AiVM",
+    "森": "https://www.youtube.com/watch?v=eNUpTV9BGac",
+    "ホワイトノイズ": "https://www.youtube.com/watch?v=E1bbH03JhKA",
+}
+
+def _mask(user, category): return user.get(f"{category}_mask") or 1
+
+def owns(user, category, item):
+    bit = ITEM_BITS[category].get(item)
+    return bit is not None and bool(_mask(user, category) >> bit & 1)
+
+@functools.lru_cache(maxsize=256)
+def _owned(category, mask): return [name for name, _ in CATALOG[category] if mask >> ITEM_BITS[category][name] & 1]
+
+def owned_items(user, category):
+    """所持品の名前 (目録順)。マスク値ごとにメモ化する。"""
+    return _owned(category, _mask(user, category))
+
+# --- デザイン適用関数 (カレンダー色固定版) ---
+# フォント名 -> (font-family, 総称ファミリー)。フォントファイルは static/fonts/<family>.woff2 に同梱したサブセットを使う
+FONTS = {
+    "ピクセル風": ("DotGothic16", "sans-serif"),
+    "手書き風": ("Yomogi", "cursive"),
+    "ポップ": ("Hachi Maru Pop", "cursive"),
+    "明朝体": ("Shippori Mincho", "serif"),
+    "筆文字": ("Yuji Syuku", "serif"),
+}
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "fonts")
+
+def font_face_css(user_theme):
+    """使用中のフォント1書体だけを読み込むCSS。同梱ファイルが無い環境ではGoogle Fontsの該当書体のみを読む。"""
+    if user_theme not in FONTS: return ""
+    family = FONTS[user_theme][0]
+    file_name = family.replace(" ", "") + ".woff2"
+    if os.path.exists(os.path.join(FONT_DIR, file_name)):
+        return f"@font-face {{ font-family: '{family}'; src: url('app/static/fonts/{file_name}') format('woff2'); font-display: swap; }}"
+    return f"@import url('https://fonts.googleapis.com/css2?family={family.replace(' ', '+')}&display=swap');"
+
+def apply_design(user_theme="標準", wallpaper="真っ白", main_text_color="#000000", accent_color="#FFD700"):
+    st.markdown(build_stylesheet(user_theme, wallpaper, main_text_color, accent_color), unsafe_allow_html=True)
+
+@functools.lru_cache(maxsize=128)
+def build_stylesheet(user_theme, wallpaper, main_text_color, accent_color):
+    """(テーマ, 壁紙, 文字色, アクセント色) ごとに一度だけ生成し、コメントと空白を落とした <style> を返す。"""
+    family, generic = FONTS.get(user_theme, (None, "sans-serif"))
+    font_family = f"'{family}', {generic}" if family else generic
+    
+    # 壁紙CSS
+    bg_css = "background-color: #ffffff;"
+    sidebar_bg = "#f8f9fa"
+    container_bg = "#ffffff"
+    text_color = main_text_color
+    
+    if wallpaper == "真っ黒":
+        bg_css = "background-color: #121212;"
+        sidebar_bg = "#1e1e1e"
+        container_bg = "#2d2d2d"
+        text_color = "#ffffff"
+    elif wallpaper == "夕焼け":
+        bg_css = "background-image: linear-gradient(120deg, #f6d365 0%, #fda085 100%);"
+        container_bg = "rgba(255, 255, 255, 0.9)"
+    elif wallpaper == "夜空":
+        bg_css = "background-image: linear-gradient(to top, #30cfd0 0%, #330867 100%);"
+        sidebar_bg = "rgba(0, 0, 0, 0.6)"
+        container_bg = "rgba(255, 255, 255, 0.95)"
+    elif wallpaper == "草原":
+        bg_css = "background-image: linear-gradient(120deg, #d4fc79 0%, #96e6a1 100%);"
+        container_bg = "rgba(255, 255, 255, 0.9)"
+
+    # ★カレンダー・ボタン用の固定色定義
+    fixed_cal_bg = "#ffffff"       # ボタン背景：白固定
+    fixed_cal_text = "#333333"     # ボタン文字：黒固定
+    fixed_cal_border = "#e0e0e0"   # ボタン枠線：グレー固定
+    fixed_cal_select = "#FFD700"   # 選択時：ゴールド固定（アクセントカラーに依存しない）
+    fixed_cal_hover = "#fffdf0"    # ホバー時：薄いクリーム色固定
+
+    css = f"""
+    {font_face_css(user_theme)}
+
+    /* 1. ベースフォント設定 */
+    html, body, [data-testid="stAppViewContainer"] {{
+        font-family: {font_family}, sans-serif;
+        {bg_css}
+    }}
+    
+    /* 2. テキスト要素への適用 */
+    h1, h2, h3, h4, h5, h6, p, label, li, a, .stMarkdown, .stText {{
+        font-family: {font_family}, sans-serif !important;
+        color: {text_color} !important;
+    }}
+    
+    /* 3. 入力フォームとボタンのフォント */
+    input, textarea, select, button, .stButton button, .stSelectbox div {{
+        font-family: {font_family}, sans-serif !important;
+    }}
+
+    /* サイドバー */
+    [data-testid="stSidebar"] {{ 
+        background-color: {sidebar_bg} !important; 
+        border-right: 1px solid rgba(128,128,128,0.2); 
+    }}
+    [data-testid="stSidebar"] * {{ 
+        color: {main_text_color} !important; 
+    }}
+
+    /* 入力フォームの背景色固定 (白) */
+    input, textarea, select {{
+        background-color: #ffffff !important; 
+        color: #000000 !important; 
+        border: 1px solid #ccc !important;
+    }}
+    div[data-baseweb="select"] > div {{ 
+        background-color: #ffffff !important; 
+        color: #000000 !important; 
+    }}
+
+    /* ★カレンダーの日付ボタン (色を完全固定) */
+    .stButton button {{
+        width: 100%; 
+        height: 70px; 
+        white-space: pre-wrap; 
+        line-height: 1.1; 
+        padding: 2px;
+        border: 1px solid {fixed_cal_border} !important; 
+        background-color: {fixed_cal_bg} !important; 
+        color: {fixed_cal_text} !important;
+        transition: all 0.2s; 
+        border-radius: 8px;
+    }}
+    .stButton button:hover {{
+        border-color: {fixed_cal_select} !important; 
+        background-color: {fixed_cal_hover} !important; 
+        transform: translateY(-2px); 
+        z-index: 10; 
+        position: relative;
+    }}
+    
+    /* ★選択中の日付ボタン (色を完全固定・primary上書き) */
+    div[data-testid="stVerticalBlock"] .stButton button[kind="primary"] {{
+        background-color: {fixed_cal_select} !important; 
+        border-color: #e6c200 !important; 
+        color: #000000 !important; /* 文字色は黒固定 */
+        font-weight: bold; 
+        border-width: 2px;
+    }}
+
+    /* コンテナ */
+    div[data-testid="stVerticalBlockBorderWrapper"], div[data-testid="stExpander"], div[data-testid="stForm"] {{
+        background-color: {container_bg} !important;
+        border: 1px solid rgba(128,128,128,0.2); border-radius: 12px; padding: 20px;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+    }}
+    
+    /* ステータスバー */
+    .status-bar {{
+        background: {container_bg}; border: 1px solid rgba(128,128,128,0.2); 
+        padding: 15px; border-radius: 12px; display: flex; justify-content: space-around; align-items: center; margin-bottom: 20px;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+    }}
+    .stat-val {{ font-size: 1.6em; font-weight: bold; }}
+    
+    /* 単位表示 (メイン文字色) */
+    .stat-unit {{
+        font-size: 0.6em;
+        font-weight: normal;
+        margin-left: 3px;
+        color: {main_text_color} !important;
+    }}
+    
+    /* アクションボタンも固定色（ゴールド）にする */
+    button[kind="primary"] {{
+        background: {fixed_cal_select} !important; 
+        border: none !important; 
+        color: #000 !important; 
+        font-weight: bold !important;
+    }}
+
+    /* ランキングデザイン */
+    .ranking-card {{
+        padding: 15px; margin-bottom: 12px; border-radius: 15px; 
+        display: flex; align-items: center; 
+        background: {container_bg};
+        border: 1px solid rgba(128,128,128,0.1);
+        transition: transform 0.2s;
+        box-shadow: 0 2px 5px rgba(0,0,0,0.05);
+    }}
+    .ranking-card:hover {{ transform: scale(1.02); }}
+
+    .rank-1 {{ background: linear-gradient(135deg, #FFF8E1 0%, #FFD700 100%) !important; border: 2px solid #FFD700 !important; }}
+    .rank-1 .rank-name, .rank-1 .rank-score {{ color: #5c4d00 !important; text-shadow: 0 1px 0 rgba(255,255,255,0.6); }}
+    .rank-2 {{ background: linear-gradient(135deg, #F5F5F5 0%, #C0C0C0 100%) !important; border: 2px solid #C0C0C0 !important; }}
+    .rank-3 {{ background: linear-gradient(135deg, #FFF0E0 0%, #CD7F32 100%) !important; border: 2px solid #CD7F32 !important; }}
+    
+    .rank-medal {{ font-size: 2.5rem; width: 60px; text-align: center; margin-right: 10px; }}
+    .rank-info {{ flex-grow: 1; }}
+    .rank-name {{ font-size: 1.3em; font-weight: 800; color: {text_color}; }}
+    .rank-title {{ font-size: 0.8em; opacity: 0.8; color: {text_color}; }}
+    .rank-score {{ font-size: 1.5em; font-weight: 900; text-align: right; margin-right: 10px; color: {accent_color}; }}
+    """
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    return "<style>" + re.sub(r"\s+", " ", css).strip() + "</style>"
+
+# --- 認証・DB操作 ---
+def make_hashes(password): return hashlib.sha256(str.encode(password)).hexdigest()
+def check_hashes(password, hashed_text): return make_hashes(password) == hashed_text
+
+# --- セッショントークン (署名付きCookie) ---
+# 形式: base64(ユーザーID).有効期限(UNIX秒).session_epoch.HMAC署名
+# 署名と期限はDBを引かずに検証し、session_epoch はどのみち読み込むユーザー行と照合する (ログアウトで +1 され失効)
+# 署名鍵は secrets の [auth].secret 専用。公開前提の Supabase anon key では誰でも署名できてしまうため、未設定ならCookieログイン自体を無効にする
+AUTH_COOKIE = "logtask_auth"
+SESSION_DAYS = 7
+
+def _session_secret():
+    try: return st.secrets["auth"]["secret"].encode() or None
+    except (KeyError, FileNotFoundError): return None
+
+def cookie_login_enabled(): return _session_secret() is not None
+
+def _sign(payload): return hmac.new(_session_secret(), payload.encode(), hashlib.sha256).hexdigest()
+
+def make_session_token(username, epoch=0, days=SESSION_DAYS):
+    uid = base64.urlsafe_b64encode(username.encode()).decode()
+    payload = f"{uid}.{int(time.time()) + days * 86400}.{epoch}"
+    return f"{payload}.{_sign(payload)}"
+
+def verify_session_token(token):
+    """正しく署名され期限内のトークンなら (ユーザーID, session_epoch)、それ以外は None を返す。"""
+    if not cookie_login_enabled(): return None
+    try:
+        uid, expires, epoch, sig = token.split(".")
+        if not hmac.compare_digest(sig, _sign(f"{uid}.{expires}.{epoch}")) or int(expires) < time.time(): return None
+        return base64.urlsafe_b64decode(uid.encode()).decode(), int(epoch)
+    except: return None
+
+def revoke_sessions(username):
+    """session_epoch をDB側で +1 し、発行済みのトークンをすべて失効させる (キャッシュ済みの値からは計算しない)。"""
+    try: supabase.rpc("revoke_sessions", {"p_username": username}).execute()
+    except: pass
+    invalidate_cache(username, "user")
+
+def login_user(username, password):
+    try:
+        res = supabase.table("users").select("password").eq("username", username).execute()
+        if res.data and check_hashes(password, res.data[0]["password"]): return True, "成功"
+        return False, "IDまたはパスワードが違います"
+    except: return False, "エラー"
+
+def add_user(username, password, nickname):
+    try:
+        data = {
+            "username": username, "password": make_hashes(password), "nickname": nickname, 
+            "xp": 0, "coins": 0, 
+            "current_theme": "標準", "current_title": "見習い", "current_wallpaper": "真っ白", "current_bgm": "なし", 
+            "daily_goal": 60, "main_text_color": "#000000", "accent_color": "#FFD700"
+        }
+        supabase.table("users").insert(data).execute()
+        return True, "登録成功"
+    except: return False, "エラー"
+
+# --- セッションキャッシュ (ユーザー単位・TTL付き) ---
+CACHE_TTL = 300  # 秒。他端末での変更はこの時間内に反映される
+CACHE_MAX_ENTRIES = 64  # 日付・期間ごとにキーが増えるので、超えたら最後に使ってから最も古いものから捨てる
+
+def _cache_store():
+    return st.session_state.setdefault("_db_cache", {})
+
+def _cache_get(key):
+    store = _cache_store()
+    hit = store.get(key)
+    if not hit or hit[0] <= time.time(): return None
+    store[key] = store.pop(key)  # 使ったキーを末尾へ (dict の順序を LRU として使う)
+    return hit[1]
+
+def _cache_put(key, value, ttl=CACHE_TTL):
+    store, now = _cache_store(), time.time()
+    versions = st.session_state.setdefault("_db_versions", {})
+    store.pop(key, None)
+    store[key] = (now + ttl, value)
+    # 版数はセッション内で一意に増やす (捨てたキーを読み直しても古い版数と重ならない)
+    st.session_state["_db_version_seq"] = versions[key] = st.session_state.get("_db_version_seq", 0) + 1
+    for k in [k for k, (expires, _) in store.items() if expires <= now]:
+        del store[k]; versions.pop(k, None)
+    for k in list(store)[:max(0, len(store) - CACHE_MAX_ENTRIES)]:
+        del store[k]; versions.pop(k, None)
+    st.session_state.get("_fetch_errors", {}).pop(key, None)
+
+# 読み込み失敗として記録・表示する例外 (通信・DB側のエラー)。TypeError などコードの誤りは握りつぶさずにそのまま上げる
+FETCH_ERRORS = (APIError, httpx.HTTPError, OSError, TimeoutError)
+
+def _fetch_errors():
+    """この再実行で読み込みに失敗したキー -> 例外。main() の先頭で空にする。"""
+    return st.session_state.setdefault("_fetch_errors", {})
+
+def cached(kind, username, loader, fallback=lambda: None, args=(), ttl=CACHE_TTL):
+    """(kind, username, *args) 単位で loader の結果を保持する。失敗時は fallback() を返し、キャッシュしない。"""
+    key = (kind, username) + tuple(args)
+    value = _cache_get(key)
+    if value is not None: return value
+    if key in _fetch_errors(): return fallback()  # 同じ再実行の中では失敗した読み込みを繰り返さない
+    try: value = loader(username, *args)
+    except FETCH_ERRORS as e:
+        _fetch_errors()[key] = e
+        return fallback()
+    if value is None: return fallback()
+    _cache_put(key, value, ttl)
+    return value
+
+def cache_version(kind, username, *args):
+    """読み込みのたびに増えるデータ版数。派生データのメモ化キーに使う。"""
+    return st.session_state.get("_db_versions", {}).get((kind, username) + args, 0)
+
+def invalidate_cache(username, *kinds):
+    """指定した種類 (省略時は全種類) のキャッシュを破棄する。"""
+    store = _cache_store()
+    for key in [k for k in store if k[1] == username and (not kinds or k[0] in kinds)]:
+        del store[key]
+    if not kinds: st.session_state.get("_log_history", {}).pop(username, None)
+
+def patch_cached_user(username, fields):
+    hit = _cache_store().get(("user", username))
+    if hit: hit[1].update(fields)
+
+def update_user(username, fields):
+    supabase.table("users").update(fields).eq("username", username).execute()
+    patch_cached_user(username, fields)
+
+# --- 設定変更の書き込みバッファ ---
+PREF_FLUSH_INTERVAL = 5  # 秒。最後の変更からこの時間操作が無ければまとめて保存する
+
+def stage_pref(username, field, value):
+    """設定変更をキャッシュ上のユーザー行へ即座に反映し、DBへの書き込みは flush_prefs まで保留する。"""
+    st.session_state.setdefault("_pending_prefs", {})[field] = value
+    st.session_state["_pending_at"] = time.time()
+    patch_cached_user(username, {field: value})
+
+def flush_prefs(username, force=False):
+    """保留中の設定変更を users への1回の update にまとめて書き込む。"""
+    pending = st.session_state.get("_pending_prefs")
+    if not pending: return
+    if not force and time.time() - st.session_state.get("_pending_at", 0) < PREF_FLUSH_INTERVAL: return
+    try: update_user(username, pending)
+    except: return
+    st.session_state["_pending_prefs"] = {}
+
+def _on_pref_change(field, key):
+    stage_pref(st.session_state["username"], field, st.session_state[key])
+
+@st.fragment(run_every=PREF_FLUSH_INTERVAL)
+def pref_flusher(username):
+    """保留中の変更がある間だけ置かれ、操作が止まった後の書き込みを担う。"""
+    flush_prefs(username)
+    # 書き込めたらアプリ全体を再実行してこのフラグメントを外す (空のまま5秒ごとに再実行し続けない)
+    if not st.session_state.get("_pending_prefs"): st.rerun()
+
+# 画面で使う列だけを取得する (password などは読まない)
+USER_COLUMNS = ['username', 'nickname', 'xp', 'coins', 'daily_goal', 'main_text_color', 'accent_color',
+                'current_theme', 'current_title', 'current_wallpaper', 'current_bgm',
+                'themes_mask', 'titles_mask', 'wallpapers_mask', 'bgms_mask', 'last_login_date', 'session_epoch']
+LOG_COLUMNS = ['id', 'subject', 'duration_minutes', 'study_date']
+TASK_COLUMNS = ['id', 'task_name', 'status', 'due_date', 'priority']
+# 読み込み時に一度だけ型を決める (日付は datetime64、繰り返す文字列は category、分数は int32)
+LOG_DTYPES = {'id': 'int64', 'subject': 'category', 'duration_minutes': 'int32'}
+TASK_DTYPES = {'id': 'int64', 'task_name': 'string', 'status': 'category', 'priority': 'category'}
+
+def _frame(rows, columns, dtypes, date_col):
+    df = pd.DataFrame(rows, columns=columns).astype(dtypes)
+    df[date_col] = pd.to_datetime(df[date_col], format='%Y-%m-%d', errors='coerce')
+    return df
+
+def log_frame(rows=()): return _frame(rows, LOG_COLUMNS, LOG_DTYPES, 'study_date')
+def task_frame(rows=()): return _frame(rows, TASK_COLUMNS, TASK_DTYPES, 'due_date')
+
+def _load_user(username):
+    res = supabase.table("users").select(",".join(USER_COLUMNS)).eq("username", username).execute()
+    return res.data[0] if res.data else None
+
+def _load_subjects(username):
+    res = supabase.table("subjects").select("subject_name").eq("username", username).execute()
+    return [r['subject_name'] for r in res.data]
+
+def _load_study_logs(u, start=None, end=None, limit=None):
+    q = supabase.table("study_logs").select(",".join(LOG_COLUMNS)).eq("username", u)
+    if start: q = q.gte("study_date", str(start))
+    if end: q = q.lte("study_date", str(end))
+    q = q.order("created_at", desc=True)
+    if limit: q = q.limit(limit)
+    res = q.execute()
+    return log_frame(res.data)
+
+def merge_new_study_logs(u, held=None):
+    """held より新しい行 (id が最大値より大きい行) だけを取得して先頭にマージする。held が無ければ全件読む。"""
+    if held is None or held.empty: return _load_study_logs(u)
+    res = supabase.table("study_logs").select(",".join(LOG_COLUMNS)).eq("username", u).gt("id", int(held['id'].max())).order("created_at", desc=True).execute()
+    if not res.data: return held
+    # 新しい科目が増えると category が object に戻るため、結合後に型を揃え直す
+    return pd.concat([log_frame(res.data), held], ignore_index=True).drop_duplicates('id').astype(LOG_DTYPES)
+
+def _load_log_history(u, _tag):
+    held = st.session_state.setdefault("_log_history", {})
+    held[u] = merge_new_study_logs(u, held.get(u))
+    return held[u]
+
+def _load_tasks(u, start, end):
+    """未完了のタスク全件と、期日が [start, end] に入る完了済みタスク。"""
+    res = (supabase.table("tasks").select(",".join(TASK_COLUMNS)).eq("username", u)
+           .or_(f"status.eq.未完了,and(due_date.gte.{start},due_date.lte.{end})").order("due_date").execute())
+    return task_frame(res.data)
+
+DONE_PAGE_SIZE = 20
+
+def _load_done_tasks(u, _tag, page):
+    res = (supabase.table("tasks").select(",".join(TASK_COLUMNS)).eq("username", u).eq("status", "完了")
+           .order("due_date", desc=True).order("id", desc=True).range(page * DONE_PAGE_SIZE, (page + 1) * DONE_PAGE_SIZE - 1).execute())
+    return task_frame(res.data)
+
+SESSION_COLUMNS = ['subject', 'started_at', 'accumulated_seconds']
+
+def _load_session(username):
+    # 計測中でなければ {} (None だとキャッシュされず毎回読みに行くため)
+    res = supabase.table("active_sessions").select(",".join(SESSION_COLUMNS)).eq("username", username).execute()
+    return res.data[0] if res.data else {}
+
+def _load_day_total(u, day):
+    # daily_study_totals は study_logs のトリガーで維持される日別合計 (1ユーザー1日1行)
+    res = supabase.table("daily_study_totals").select("minutes").eq("username", u).eq("study_date", str(day)).execute()
+    return res.data[0]['minutes'] if res.data else 0
+
+def _load_day_totals(u, _tag, start, end):
+    res = (supabase.table("daily_study_totals").select("study_date,minutes").eq("username", u)
+           .gte("study_date", str(start)).lte("study_date", str(end)).execute())
+    return {r['study_date']: r['minutes'] for r in res.data if r['minutes'] > 0}
+
+def _empty_logs(): return log_frame()
+
+# ソース名 -> (キャッシュ種別, loader, 失敗時の値, 固定引数)。getter と FetchPlan の両方がここを参照する
+SOURCES = {
+    "user": ("user", _load_user, lambda: None, ()),
+    "subjects": ("subjects", _load_subjects, list, ()),
+    "session": ("session", _load_session, dict, ()),
+    "logs": ("logs", _load_study_logs, _empty_logs, ()),
+    "history": ("logs", _load_log_history, _empty_logs, ("history",)),
+    "totals": ("totals", _load_day_total, int, ()),
+    "day_totals": ("totals", _load_day_totals, dict, ("range",)),
+    "tasks": ("tasks", _load_tasks, task_frame, ()),
+    "done_tasks": ("tasks", _load_done_tasks, task_frame, ("done",)),
+}
+
+def load(source, u, *args):
+    kind, loader, fallback, fixed = SOURCES[source]
+    return cached(kind, u, loader, fallback, fixed + args)
+
+def fetch_failed(source, u, *args):
+    """この再実行で source の読み込みが失敗したか (画面側で部分的なエラー表示に使う)。"""
+    kind, _, _, fixed = SOURCES[source]
+    return (kind, u) + fixed + args in _fetch_errors()
+
+def fragment_rerun():
+    """フラグメントだけが再実行されている (main() を通っていない) か。"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+def warn_if_failed(label, source, u, *args):
+    if fetch_failed(source, u, *args): st.warning(f"{label}を読み込めませんでした。しばらくしてから再読み込みしてください")
+
+def get_user_data(username): return load("user", username)
+def get_subjects(username): return load("subjects", username)
+def get_active_session(username): return load("session", username) or None
+
+def get_study_logs(u, start=None, end=None, limit=None):
+    """study_date が [start, end] に入るログを新しい順に最大 limit 件返す (省略した条件は無制限)。"""
+    return load("logs", u, start, end, limit)
+
+def get_day_total(u, day):
+    """day (JST) の勉強時間の合計 (分)。送信待ちの記録は含まない。"""
+    return load("totals", u, day)
+
+def get_day_totals(u, start, end):
+    """start〜end の日付文字列 -> 勉強時間の合計 (分)。記録のない日は含まない。"""
+    return load("day_totals", u, start, end)
+
+def get_log_history(u):
+    """全履歴。初回以降は書き込みやTTL切れのたびに差分だけを取得してマージする。"""
+    return load("history", u)
+
+def get_tasks(u, start, end):
+    """期日が [start, end] の完了済みタスクと、期日に関係なく未完了のタスク。"""
+    return load("tasks", u, start, end)
+
+def get_completed_tasks(u, page=0):
+    """完了済みタスクを期日の新しい順に DONE_PAGE_SIZE 件ずつ (表示窓より前の分を必要なときだけ読む)。"""
+    return load("done_tasks", u, page)
+
+# --- 並列取得 ---
+FETCH_TIMEOUT = 20  # 秒
+
+class FetchPlan:
+    """再実行の先頭で必要なデータを宣言し、キャッシュに無いものだけを同時に取得してキャッシュに入れる。
+    失敗はソースごとに記録され (fetch_failed)、他のソースや画面全体には影響しない。"""
+
+    def __init__(self, username):
+        self.username = username
+        self.sources = []
+        self.calls = []
+
+    def add(self, source, *args):
+        self.sources.append((source, args))
+        return self
+
+    def call(self, fn, *args):
+        """st.cache_data 付きの関数など、セッションキャッシュを通らない読み込みを先に温めておく。"""
+        self.calls.append((fn, args))
+        return self
+
+    def run(self):
+        jobs = {}
+        for source, args in self.sources:
+            kind, loader, _, fixed = SOURCES[source]
+            key = (kind, self.username) + fixed + args
+            if key in jobs or _cache_get(key) is not None or key in _fetch_errors(): continue
+            jobs[key] = (loader, (self.username,) + fixed + args)
+        jobs.update({("call", i): (fn, args) for i, (fn, args) in enumerate(self.calls)})
+        if not jobs: return
+
+        results = {}
+        def work(key, fn, args, pctx):
+            try: results[key] = (True, pctx.run(fn, *args))
+            except Exception as e: results[key] = (False, e)
+
+        if len(jobs) == 1:
+            (key, (fn, args)), = jobs.items()
+            work(key, fn, args, contextvars.copy_context())
+        else:
+            ctx = get_script_run_ctx(suppress_warning=True)
+            threads = []
+            for key, (fn, args) in jobs.items():
+                t = threading.Thread(target=work, args=(key, fn, args, contextvars.copy_context()), daemon=True)
+                if ctx: add_script_run_ctx(t, ctx)
+                t.start()
+                threads.append(t)
+            deadline = time.time() + FETCH_TIMEOUT
+            for t in threads: t.join(max(0, deadline - time.time()))
+
+        for key in jobs:
+            if key[0] == "call": continue
+            ok, value = results.get(key, (False, TimeoutError("fetch timed out")))
+            if not ok and not isinstance(value, FETCH_ERRORS): raise value
+            if not ok: _fetch_errors()[key] = value
+            elif value is not None: _cache_put(key, value)
+
+# --- 日別集計インデックス ---
+EMPTY_DAY = {"minutes": 0, "open_tasks": 0, "log_rows": [], "task_rows": []}
+
+def build_day_index(logs_df, tasks):
+    """日付文字列 -> 勉強分数・未完了タスク数・該当行位置 の索引を groupby 一回ずつで作る。"""
+    index = {}
+    if not logs_df.empty:
+        days = logs_df['study_date']
+        minutes = logs_df['duration_minutes'].groupby(days).sum()
+        for d, rows in days.groupby(days).indices.items():
+            index[f"{d:%Y-%m-%d}"] = dict(EMPTY_DAY, minutes=int(minutes[d]), log_rows=rows)
+    if tasks is not None and not tasks.empty:
+        days = tasks['due_date']
+        open_cnt = (tasks['status'] == '未完了').groupby(days).sum()
+        for d, rows in days.groupby(days).indices.items():
+            key = f"{d:%Y-%m-%d}"
+            index[key] = dict(index.get(key, EMPTY_DAY), open_tasks=int(open_cnt[d]), task_rows=rows)
+    return index
+
+DAY_INDEX_MAX = 8  # 保持する索引 (表示月・選択日の窓) の数
+
+def get_day_index(u, window, logs_df, tasks, task_window=None):
+    """get_study_logs(u, *window) と get_tasks(u, *task_window) の結果について、版数が変わらない限り前回の索引を使い回す。"""
+    task_window = task_window or window[:2]
+    key = (u, cache_version("logs", u, *window), cache_version("tasks", u, *task_window) if tasks is not None else None, task_window)
+    memo = st.session_state.setdefault("_day_index", {})
+    hit = memo.pop(window, None)
+    index = hit[1] if hit and hit[0] == key else build_day_index(logs_df, tasks)
+    memo[window] = (key, index)  # 末尾へ。クリックした日ごとに窓が増えるので古いものから捨てる
+    for w in list(memo)[:max(0, len(memo) - DAY_INDEX_MAX)]: del memo[w]
+    return index
+
+def get_analytics(u, daily_goal):
+    """全履歴の集計。履歴の版数・目標・日付が変わらない限り前回の結果を使い回す。"""
+    history = get_log_history(u)
+    today = jst_today()
+    key = (cache_version("logs", u, "history"), daily_goal, today)
+    memo = st.session_state.setdefault("_analytics", {})
+    if u in memo and memo[u][0] == key: return memo[u][1]
+    stats = analytics.compute(history, daily_goal, today)
+    memo[u] = (key, stats)
+    return stats
+
+def get_today_minutes(u):
+    today = jst_today()
+    queued = sum(r['minutes'] for r in pending_study_logs(u) if r['study_date'] == str(today))
+    return get_day_total(u, today) + queued
+
+def add_subject_db(u, s):
+    supabase.table("subjects").insert({"username": u, "subject_name": s}).execute()
+    invalidate_cache(u, "subjects")
+
+def delete_subject_db(u, s):
+    supabase.table("subjects").delete().eq("username", u).eq("subject_name", s).execute()
+    invalidate_cache(u, "subjects")
+
+# --- 演出キュー (トースト・風船は操作側で積み、次の描画でまとめて出す。待ち時間を入れない) ---
+def push_effect(kind, message=None, icon=None):
+    """kind: "toast" | "balloons"。st.rerun() の直前に積んでも次の再実行で表示される。"""
+    st.session_state.setdefault("_effects", []).append((kind, message, icon))
+
+def drain_effects():
+    for kind, message, icon in st.session_state.pop("_effects", []):
+        if kind == "toast": st.toast(message, icon=icon)
+        elif kind == "balloons": st.balloons()
+
+# --- 報酬・ウォレット (DB関数で1往復・アトミックに更新) ---
+def _wallet_rpc(u, fn, params):
+    """報酬・購入系のDB関数を呼び、返ってきた最新のユーザー行でキャッシュを更新する。"""
+    res = supabase.rpc(fn, dict(params, p_username=u)).execute()
+    out = res.data or {}
+    if out.get("user"): patch_cached_user(u, out["user"])
+    return out
+
+def add_study_log(u, s, m, d):
+    today = jst_today()
+    out = _wallet_rpc(u, "log_study", {"p_subject": s, "p_minutes": m, "p_study_date": str(d), "p_today": str(today)})
+    invalidate_cache(u, "logs", "totals")
+    if "today_minutes" in out: _cache_put(("totals", u, today), out["today_minutes"])
+    ud = out.get("user") or {}
+    return m, ud.get('xp', 0), ud.get('coins', 0), bool(out.get("goal_reached"))
+
+# --- 勉強ログの書き込み待ち行列 (記録はローカルに書いて即座に戻り、送信はバックグラウンドで行う) ---
+OUTBOX_PATH = os.environ.get("LOGTASK_OUTBOX", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".logtask", "outbox.sqlite3"))
+
+def _send_study_logs(username, entries):
+    return supabase.rpc("log_study_batch", {"p_username": username, "p_entries": entries}).execute().data
+
+@st.cache_resource
+def get_outbox():
+    os.makedirs(os.path.dirname(OUTBOX_PATH), exist_ok=True)
+    return outbox.Outbox(OUTBOX_PATH, _send_study_logs).start()
+
+def queue_study_log(u, s, m, d):
+    """待ち行列に記録してすぐ戻る。送信が終わるまでは XP・コインを見込みの値で表示する。"""
+    get_outbox().enqueue(u, s, m, d, jst_today())
+    user = get_user_data(u)
+    if user: patch_cached_user(u, {"xp": user['xp'] + m, "coins": user['coins'] + m})
+
+def record_study_log(u, s, m, d):
+    """待ち行列に書けなければその場で同期的に記録する。どちらも失敗したら False。"""
+    try: queue_study_log(u, s, m, d)
+    except Exception:
+        try: add_study_log(u, s, m, d)
+        except Exception: return False
+    return True
+
+def pending_study_logs(u):
+    try: return get_outbox().pending(u)
+    except: return []
+
+def failed_study_logs(u):
+    try: return get_outbox().failed(u)
+    except: return []
+
+def apply_outbox_results(u):
+    """送信が進んでいれば (世代番号が変わっていれば) ログとユーザー行のキャッシュを捨て、目標達成を通知する。"""
+    try: box = get_outbox()
+    except Exception: return  # 待ち行列が使えない (書き込めないパス等) ときは記録が同期書き込みに切り替わる
+    seen = st.session_state.setdefault("_outbox_gen", {})
+    gen = box.generation(u)
+    if seen.get(u) == gen: return
+    seen[u] = gen
+    notices = box.pop_notices(u)
+    # 送信結果を受け取ったセッションは返ってきたユーザー行で更新し、他のセッションは読み直す
+    if notices: invalidate_cache(u, "logs", "totals")
+    else: invalidate_cache(u, "logs", "totals", "user")
+    for out in notices: patch_cached_user(u, out["user"])
+    queued = sum(r['minutes'] for r in pending_study_logs(u))
+    user = _cache_get(("user", u))
+    if notices and queued and user: patch_cached_user(u, {"xp": user['xp'] + queued, "coins": user['coins'] + queued})
+    if any(out.get("goal_reached") for out in notices):
+        push_effect("toast", "🎉 目標達成！ ボーナス +100コイン")
+
+@st.fragment(run_every=2)
+def outbox_watcher(username):
+    """送信待ちがある間だけ置かれ、送信が終わったら画面全体を更新する。"""
+    if get_outbox().generation(username) != st.session_state.get("_outbox_gen", {}).get(username): st.rerun()
+
+def delete_study_log(lid, u):
+    _wallet_rpc(u, "remove_study_log", {"p_id": int(lid)})
+    held = st.session_state.get("_log_history", {})
+    if u in held: held[u] = held[u][held[u]['id'] != lid]
+    invalidate_cache(u, "logs", "totals")
+
+def claim_login_bonus(u):
+    """本日未受取ならログインボーナスを付与して True を返す。"""
+    return bool(_wallet_rpc(u, "claim_login_bonus", {"p_today": str(jst_today())}).get("ok"))
+
+def purchase_item(u, category, item, price=None):
+    """目録の価格 (称号はガチャ代) を支払って item の所持ビットを立てる。残高不足なら None、成功時は新規解放かどうかを返す。"""
+    if price is None: price = CATALOG[category][ITEM_BITS[category][item]][1] or GACHA_PRICE
+    out = _wallet_rpc(u, "purchase_item", {"p_price": price, "p_category": category, "p_bit": ITEM_BITS[category][item]})
+    return bool(out.get("granted")) if out.get("ok") else None
+
+def add_task(u, n, d, p):
+    supabase.table("tasks").insert({"username": u, "task_name": n, "status": "未完了", "due_date": str(d), "priority": p}).execute()
+    invalidate_cache(u, "tasks")
+
+def delete_task(tid, u):
+    supabase.table("tasks").delete().eq("id", tid).execute()
+    invalidate_cache(u, "tasks")
+
+def complete_task(tid, u):
+    _wallet_rpc(u, "complete_task_reward", {"p_id": int(tid)})
+    invalidate_cache(u, "tasks")
+
+# --- 勉強セッション (タイマーの状態はDBの active_sessions が持ち、どのレプリカからでも再開できる) ---
+def session_elapsed(session):
+    """経過秒数。一時停止中は started_at が空で、accumulated_seconds がそのまま経過時間。"""
+    started = session.get("started_at")
+    running = (datetime.now(timezone.utc) - datetime.fromisoformat(started)).total_seconds() if started else 0
+    return int((session.get("accumulated_seconds") or 0) + max(0, running))
+
+def session_transition(u, fn, **params):
+    """start/pause/resume/stop_session を1回呼び、返ってきた行でキャッシュを置き換える。通信に失敗したら None。"""
+    try: out = supabase.rpc(fn, dict(params, p_username=u)).execute().data or {}
+    except FETCH_ERRORS:
+        push_effect("toast", "⚠️ 通信に失敗しました。もう一度お試しください", icon="⚠️")
+        return None
+    row = out.get("session") or {}
+    _cache_put(("session", u), {k: row.get(k) for k in SESSION_COLUMNS} if out.get("ok") and fn != "stop_session" else {})
+    return out
+
+# --- インポート (検証済みの行をまとめて insert し、報酬は最後に1回だけ付与) ---
+def import_records(u, table, rows):
+    inserted = 0
+    try:
+        for batch in data_io.batches(rows):
+            supabase.table(table).insert([dict(r, username=u) for r in batch]).execute()
+            inserted += len(batch)
+    finally:
+        if table == "study_logs" and inserted:
+            _wallet_rpc(u, "grant_import_reward", {"p_minutes": sum(r['duration_minutes'] for r in rows[:inserted])})
+        invalidate_cache(u)
+    return inserted
+
+# --- 週間ランキング (DB側集計・全セッション共有キャッシュ) ---
+RANKING_TTL = 30  # 秒
+RANKING_PAGE_SIZE = 10
+RANKING_COLUMNS = ['rank', 'username', 'nickname', 'current_title', 'duration_minutes']
+
+def _ranking_since(): return str(jst_today() - timedelta(days=7))
+
+@st.cache_data(ttl=RANKING_TTL, show_spinner=False)
+def _load_weekly_ranking(since, limit, offset):
+    # ページ単位でプロセス全体にキャッシュする (同じページを見る全ユーザーで共有)
+    res = supabase.rpc("weekly_leaderboard", {"p_since": since, "p_limit": limit, "p_offset": offset}).execute()
+    return pd.DataFrame(res.data, columns=RANKING_COLUMNS)
+
+@st.cache_data(ttl=RANKING_TTL, show_spinner=False)
+def _load_my_weekly_rank(since, username):
+    # 順位表全体は読まず、自分より多く勉強したユーザー数を数えるだけ
+    res = supabase.rpc("my_weekly_rank", {"p_username": username, "p_since": since}).execute()
+    return res.data[0] if res.data else None
+
+def get_weekly_ranking(limit=RANKING_PAGE_SIZE, offset=0):
+    try: return _load_weekly_ranking(_ranking_since(), limit, offset)
+    except FETCH_ERRORS: return pd.DataFrame(columns=RANKING_COLUMNS)
+
+def get_my_weekly_rank(username):
+    try: return _load_my_weekly_rank(_ranking_since(), username)
+    except FETCH_ERRORS: return None
+
+# --- タイマー ---
+def render_clock(elapsed, running, color="#000000"):
+    """経過秒数を描画し、計測中ならブラウザ側で1秒ごとに進める (サーバーへの再実行は発生しない)。"""
+    components.html(f"""
+    <div id="clock" style="text-align: center; font-size: 6em; font-weight: bold; font-family: sans-serif; color: {color};"></div>
+    <script>
+    const base = {elapsed}, running = {'true' if running else 'false'}, t0 = performance.now();
+    const pad = (n) => String(n).padStart(2, "0");
+    function tick() {{
+        const e = base + (running ? Math.floor((performance.now() - t0) / 1000) : 0);
+        document.getElementById("clock").textContent = pad(Math.floor(e / 3600)) + ":" + pad(Math.floor(e % 3600 / 60)) + ":" + pad(e % 60);
+    }}
+    tick();
+    if (running) setInterval(tick, 1000);
+    </script>
+    """, height=140)
+
+@st.fragment
+def show_timer_fragment(user_name, color="#000000"):
+    # フラグメント単独の再実行時はそれ自体を1回の再実行として計測し、読み込み失敗の記録もそこで空にする
+    if fragment_rerun(): st.session_state["_fetch_errors"] = {}
+    with profiler.rerun("timer_fragment", enabled=profiling_enabled() and profiler.current() is None, user=user_name), profiler.section("timer_fragment"):
+        _timer_body(user_name, color)
+
+def _timer_body(user_name, color):
+    session = get_active_session(user_name)
+    if not session: st.rerun()  # 別のタブ・端末で終了済み
+    is_paused = not session.get("started_at")
+    render_clock(session_elapsed(session), not is_paused, color)
+    
+    c1, c2 = st.columns(2)
+    with c1:
+        if not is_paused:
+            if st.button("⏸ 一時停止", use_container_width=True):
+                session_transition(user_name, "pause_session"); st.rerun()
+        else:
+            if st.button("▶ 再開", use_container_width=True):
+                session_transition(user_name, "resume_session"); st.rerun()
+                
+    with c2:
+        if st.button("⏹️ 終了", use_container_width=True, type="primary"):
+            out = session_transition(user_name, "stop_session")
+            if out and out.get("ok"):
+                # 経過時間はDBの時計で確定した値を使う
+                duration = max(1, out.get("elapsed_seconds", 0) // 60)
+                subject = out["session"].get("subject") or "自習"
+                # セッション行はもう消えているので、記録できなければ手動での記録を促す
+                if not record_study_log(user_name, subject, duration, jst_today()):
+                    push_effect("toast", f"記録に失敗しました。{subject} {duration}分 を手動で記録してください", "⚠️"); st.rerun()
+                push_effect("balloons"); push_effect("toast", f"{duration}分 記録しました！")
+            st.rerun()
+
+# --- カレンダー ---
+def month_window():
+    y, m = st.session_state.cal_year, st.session_state.cal_month
+    return (date(y, m, 1), date(y, m, calendar.monthrange(y, m)[1]), None)
+
+CAL_MODES = ["🗓️ カレンダー", "🔲 グリッド"]
+CAL_NAV_MONTHS = 3  # コンポーネント表示でサーバーに戻らずに移動できる前後の月数
+CAL_COLORS = {"study": "#6BCB77", "task": "#FF6B6B", "selected": "#FFD700"}
+
+def selected_day():
+    try: return datetime.strptime(st.session_state.get("selected_date", ""), '%Y-%m-%d').date()
+    except: return jst_today()
+
+def nav_window():
+    """表示中の月の前後 CAL_NAV_MONTHS か月 (この範囲の日別データをまとめてコンポーネントに渡す)。"""
+    base = st.session_state.cal_year * 12 + st.session_state.cal_month - 1
+    (y1, m1), (y2, m2) = divmod(base - CAL_NAV_MONTHS, 12), divmod(base + CAL_NAV_MONTHS, 12)
+    return (date(y1, m1 + 1, 1), date(y2, m2 + 1, calendar.monthrange(y2, m2 + 1)[1]))
+
+def calendar_events(u, window, totals, tasks):
+    """1日あたり最大2件 (勉強時間・未完了タスク数) の終日イベント。日別合計・タスクの版数が同じ間は使い回す。"""
+    key = (u, window, cache_version("totals", u, "range", *window), cache_version("tasks", u, *window))
+    memo = st.session_state.get("_cal_events")
+    if memo and memo[0] == key: return memo[1]
+    events = [{"start": d, "title": f"📖{m}分", "color": CAL_COLORS["study"]} for d, m in totals.items()]
+    if not tasks.empty:
+        open_cnt = tasks.loc[tasks['status'] == "未完了", 'due_date'].value_counts()
+        events += [{"start": f"{d:%Y-%m-%d}", "title": f"🔔{n}件", "color": CAL_COLORS["task"]} for d, n in open_cnt.items()]
+    st.session_state["_cal_events"] = (key, events)
+    return events
+
+def _clicked_date(value):
+    """コンポーネントの戻り値からクリックされた日付 (YYYY-MM-DD) を取り出す。"""
+    if not value: return None
+    if value.get("callback") == "dateClick": return value["dateClick"]["date"][:10]
+    if value.get("callback") == "eventClick": return value["eventClick"]["event"]["start"][:10]
+
+def render_calendar(user):
+    if st.radio("表示形式", CAL_MODES, key="cal_mode", horizontal=True, label_visibility="collapsed") == CAL_MODES[0]:
+        render_calendar_component(user)
+    else:
+        st.session_state.pop("_cal_value", None)  # 戻ったときに同じ日付のクリックも反映させる
+        render_calendar_grid(user)
+
+@st.fragment
+def render_calendar_component(user):
+    # 月移動はブラウザ内で完結し、日付クリックではこのフラグメントだけが再実行される
+    if fragment_rerun(): st.session_state["_fetch_errors"] = {}
+    with profiler.rerun("calendar_fragment", enabled=profiling_enabled() and profiler.current() is None, user=user['username']), profiler.section("calendar_fragment"):
+        _calendar_component_body(user)
+
+def _calendar_component_body(user):
+    u = user['username']
+    # 戻り値は次の操作まで同じ値が返り続けるので、新しいクリックだけを描画前に反映する
+    value = st.session_state.get("month_calendar")
+    if value and value != st.session_state.get("_cal_value"):
+        st.session_state["_cal_value"] = value
+        clicked = _clicked_date(value)
+        if clicked:
+            d = datetime.strptime(clicked, '%Y-%m-%d').date()
+            st.session_state.update(selected_date=clicked, cal_year=d.year, cal_month=d.month)
+    window = nav_window()
+    sel = selected_day()
+    totals = get_day_totals(u, *window)
+    tasks = get_tasks(u, *window)
+    c1, c2 = st.columns([0.65, 0.35])
+    with c1:
+        with st.container(border=True):
+            warn_if_failed("勉強記録", "day_totals", u, *window)
+            events = calendar_events(u, window, totals, tasks) + [
+                {"start": str(sel), "display": "background", "color": CAL_COLORS["selected"]}]
+            st_calendar(events=events, callbacks=["dateClick", "eventClick"], key="month_calendar", options={
+                "initialView": "dayGridMonth", "initialDate": str(sel), "timeZone": "UTC", "locale": "ja", "firstDay": 0,
+                "headerToolbar": {"left": "prev,next today", "center": "title", "right": ""},
+                "buttonText": {"today": "今日"}, "dayMaxEvents": 2,
+                "validRange": {"start": str(window[0]), "end": str(window[1] + timedelta(days=1))},
+            })
+    with c2:
+        logs_df = get_study_logs(u, sel, sel)
+        warn_if_failed("勉強記録", "logs", u, sel, sel, None)
+        task_window = window if window[0] <= sel <= window[1] else (sel, sel)
+        if task_window != window: tasks = get_tasks(u, *task_window)
+        day_index = get_day_index(u, (sel, sel, None), logs_df, tasks, task_window)
+        render_day_panel(user, str(sel), logs_df, day_index, tasks, task_window)
+
+def render_calendar_grid(user):
+    task_window = month_window()[:2]
+    tasks = get_tasks(user['username'], *task_window)
+    c1, c2 = st.columns([0.65, 0.35])
+    with c1:
+        with st.container(border=True):
+            # 月移動
+            mc1, mc2, mc3 = st.columns([0.2, 0.6, 0.2])
+            with mc1:
+                if st.button("◀ 前月"):
+                    st.session_state.cal_month -= 1
+                    if st.session_state.cal_month == 0: st.session_state.cal_month = 12; st.session_state.cal_year -= 1
+                    st.rerun()
+            with mc2:
+                st.markdown(f"<h3 style='text-align:center; margin:0; color:{user.get('main_text_color')};'>{st.session_state.cal_year}年 {st.session_state.cal_month}月</h3>", unsafe_allow_html=True)
+            with mc3:
+                if st.button("次月 ▶"):
+                    st.session_state.cal_month += 1
+                    if st.session_state.cal_month == 13: st.session_state.cal_month = 1; st.session_state.cal_year += 1
+                    st.rerun()
+
+            cols = st.columns(7)
+            weekdays = ["日", "月", "火", "水", "木", "金", "土"]
+            for i, w in enumerate(weekdays):
+                cols[i].markdown(f"<div style='text-align:center; font-weight:bold; color:#666;'>{w}</div>", unsafe_allow_html=True)
+
+            cal = calendar.Calendar(firstweekday=6)
+            month_days = cal.monthdayscalendar(st.session_state.cal_year, st.session_state.cal_month)
+            window = month_window()
+            warn_if_failed("勉強記録", "logs", user['username'], *window)
+            logs_df = get_study_logs(user['username'], *window)
+            day_index = get_day_index(user['username'], window, logs_df, tasks)
+
+            for week in month_days:
+                cols = st.columns(7)
+                for i, d in enumerate(week):
+                    with cols[i]:
+                        if d != 0:
+                            d_str = f"{st.session_state.cal_year}-{st.session_state.cal_month:02}-{d:02}"
+                            label = f"{d}"
+                            day = day_index.get(d_str, EMPTY_DAY)
+                            if day['minutes'] > 0: label += f"\n📖{day['minutes']}分"
+                            if day['open_tasks'] > 0: label += f"\n🔔{day['open_tasks']}件"
+
+                            b_type = "primary" if d_str == st.session_state.get("selected_date") else "secondary"
+                            if st.button(label, key=f"btn_{d_str}", type=b_type, use_container_width=True):
+                                st.session_state["selected_date"] = d_str
+                                st.rerun()
+                        else: st.write("")
+
+    with c2:
+        display_date = st.session_state.get("selected_date", str(jst_today()))
+        if not display_date.startswith(f"{st.session_state.cal_year}-{st.session_state.cal_month:02}"):
+            sel = selected_day()
+            logs_df = get_study_logs(user['username'], sel, sel)
+            task_window = (sel, sel)
+            tasks = get_tasks(user['username'], *task_window)
+            day_index = get_day_index(user['username'], (sel, sel, None), logs_df, tasks)
+        render_day_panel(user, display_date, logs_df, day_index, tasks, task_window)
+
+def render_day_panel(user, display_date, logs_df, day_index, tasks, task_window):
+    """選択日の勉強記録・タスク・タスク追加フォーム (グリッド・コンポーネント表示で共通)。"""
+    with st.container(border=True):
+        st.markdown(f"### 📌 {display_date}")
+
+        st.write("📚 **勉強記録**")
+        sel_day = day_index.get(display_date, EMPTY_DAY)
+        if not logs_df.empty:
+            day_logs = logs_df.iloc[sel_day['log_rows']]
+            if not day_logs.empty:
+                st.info(f"合計: {sel_day['minutes']}分")
+                for _, r in day_logs.iterrows():
+                    lc1, lc2 = st.columns([0.7, 0.3])
+                    lc1.text(f"{r['subject']}: {r['duration_minutes']}分")
+                    if lc2.button("削除", key=f"deld_{r['id']}"):
+                        delete_study_log(r['id'], user['username'])
+                        st.rerun()
+            else: st.caption("記録なし")
+        else: st.caption("記録なし")
+
+        st.divider()
+        st.write("📝 **タスク**")
+        warn_if_failed("タスク", "tasks", user['username'], *task_window)
+        if not tasks.empty:
+            dt = tasks.iloc[sel_day['task_rows']]
+            if not dt.empty:
+                for _, task in dt.iterrows():
+                    tc1, tc2, tc3 = st.columns([0.6, 0.2, 0.2])
+                    if task['status'] == "未完了":
+                        tc1.write(task['task_name'])
+                        if tc2.button("完", key=f"done_{task['id']}"):
+                            complete_task(task['id'], user['username']); st.rerun()
+                        if tc3.button("消", key=f"delt_{task['id']}"):
+                            delete_task(task['id'], user['username']); st.rerun()
+                    else: tc1.write(f"✅ {task['task_name']}")
+            else: st.caption("タスクなし")
+
+        st.divider()
+        with st.form("add_t"):
+            tn = st.text_input("タスク追加")
+            try: dd = datetime.strptime(display_date, '%Y-%m-%d').date()
+            except: dd = jst_today()
+            td = st.date_input("期日", value=dd)
+            if st.form_submit_button("追加"):
+                add_task(user['username'], tn, td, "中"); st.rerun()
+
+        # 過去の完了済みタスクは開いたときだけページ単位で読む
+        if st.toggle("✅ 完了済みタスクの履歴", key="show_done_tasks"):
+            pages = st.session_state.setdefault("done_task_pages", 1)
+            done = [get_completed_tasks(user['username'], p) for p in range(pages)]
+            warn_if_failed("完了済みタスク", "done_tasks", user['username'], pages - 1)
+            for _, task in pd.concat(done, ignore_index=True).iterrows():
+                st.caption(f"{task['due_date']:%Y-%m-%d} ✅ {task['task_name']}")
+            if len(done[-1]) == DONE_PAGE_SIZE and st.button("さらに読み込む", key="more_done_tasks"):
+                st.session_state["done_task_pages"] = pages + 1; st.rerun()
+
+# --- タイマー ---
+def render_timer(user):
+    c1, c2 = st.columns(2)
+    with c1:
+        st.subheader("🔥 集中")
+        warn_if_failed("科目", "subjects", user['username'])
+        sub = st.selectbox("科目", get_subjects(user['username']) + ["その他"])
+        if sub=="その他": sub = st.text_input("科目名")
+        if st.button("スタート", type="primary", use_container_width=True):
+            if sub:
+                out = session_transition(user['username'], "start_session", p_subject=sub)
+                if out and out.get("existing"): push_effect("toast", "計測中のセッションがあるため、その続きを表示します", "⏱️")
+                st.rerun()
+    with c2:
+        st.subheader("✏️ 記録")
+        with st.form("manual"):
+            d = st.date_input("日付", value=jst_today()); h = st.number_input("時間",0,23); m = st.number_input("分",0,59)
+            s = st.text_input("科目", value=sub if sub!="その他" else "")
+            if st.form_submit_button("記録"):
+                if not record_study_log(user['username'], s, h*60+m, d):
+                    push_effect("toast", "記録に失敗しました。もう一度お試しください", "⚠️")
+                st.rerun()
+
+    st.write("履歴 (最新5件)")
+    warn_if_failed("履歴", "logs", user['username'], None, None, 5)
+    latest = get_study_logs(user['username'], limit=5)
+    queued = pending_study_logs(user['username'])[:5]
+    for r in queued: st.text(f"{r['study_date']} : {r['subject']} ({r['minutes']}分) ☁️ 送信待ち")
+    if not latest.empty:
+        for _,r in latest.head(5 - len(queued)).iterrows():
+            st.text(f"{r['study_date']:%Y-%m-%d} : {r['subject']} ({r['duration_minutes']}分)")
+
+# --- 分析 ---
+def render_analysis(user):
+    stats = get_analytics(user['username'], user.get('daily_goal', 60))
+    warn_if_failed("勉強記録の履歴", "history", user['username'])
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("総勉強時間", f"{stats['total_minutes']//60}時間")
+    k2.metric("今日", f"{get_today_minutes(user['username'])}分")
+    k3.metric("連続日数", f"{stats['streak']}日", f"最長 {stats['longest_streak']}日", delta_color="off")
+    k4.metric("目標達成率", f"{stats['goal_rate']:.0%}", f"直近{analytics.GOAL_RATE_DAYS}日", delta_color="off")
+    if not stats['total_minutes']: st.info("まだ記録がありません"); return
+
+    range_label = st.radio("期間", list(analytics.RANGES), horizontal=True, key="analysis_range")
+    data, unit = analytics.chart_data(stats, range_label, jst_today())
+    st.caption(f"{unit}ごとの科目別合計")
+    st.altair_chart(alt.Chart(data).mark_bar().encode(
+        x=alt.X('study_date:T', title=None), y=alt.Y('minutes:Q', title='分'), color='subject:N',
+        tooltip=['study_date:T', 'subject:N', 'minutes:Q']), use_container_width=True)
+
+    c1, c2 = st.columns([0.7, 0.3])
+    with c1:
+        st.caption("直近1年")
+        st.altair_chart(alt.Chart(stats['heatmap']).mark_rect().encode(
+            x=alt.X('week:O', axis=None), y=alt.Y('weekday:O', sort=analytics.WEEKDAYS, title=None),
+            color=alt.Color('minutes:Q', scale=alt.Scale(scheme='greens'), legend=None),
+            tooltip=['date:T', 'minutes:Q']).properties(height=150), use_container_width=True)
+    with c2:
+        st.caption("科目別の合計")
+        st.dataframe(stats['by_subject'].rename("分"), use_container_width=True)
+
+# --- ランキング ---
+def render_ranking(user):
+    st.subheader("🏆 週間ランキング")
+    page = st.session_state.get("rank_page", 0)
+    rk = get_weekly_ranking(offset=page * RANKING_PAGE_SIZE)
+    if not rk.empty:
+        top_score = (get_weekly_ranking() if page else rk).iloc[0]['duration_minutes']  # 先頭ページのキャッシュを使う
+        for _, r in rk.iterrows():
+            rank = int(r['rank'])
+            if rank == 1: css_class, medal = "rank-1", "🥇"
+            elif rank == 2: css_class, medal = "rank-2", "🥈"
+            elif rank == 3: css_class, medal = "rank-3", "🥉"
+            else: css_class, medal = "", f"<span style='font-size:1.5rem; font-weight:bold; color:#888;'>{rank}</span>"
+
+            bar_width = (r['duration_minutes'] / top_score) * 100 if top_score > 0 else 0
+            st.markdown(f"""
+            <div class="ranking-card {css_class}">
+                <div class="rank-medal">{medal}</div>
+                <div class="rank-info">
+                    <div class="rank-name">{r['nickname']}</div>
+                    <div class="rank-title">👑 {r['current_title']}</div>
+                </div>
+                <div style="text-align:right;">
+                    <div class="rank-score">{int(r['duration_minutes'])} <span class="rank-unit">min</span></div>
+                    <div style="width:100px; height:6px; background:rgba(0,0,0,0.1); border-radius:3px; margin-left:auto;">
+                        <div style="width:{bar_width}%; height:100%; background:{user.get('accent_color')}; border-radius:3px;"></div>
+                    </div>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+    else: st.info("データが集計されていません")
+
+    pc1, pc2, pc3 = st.columns([0.2, 0.6, 0.2])
+    if page > 0 and pc1.button("◀ 前へ", key="rank_prev"):
+        st.session_state["rank_page"] = page - 1; st.rerun()
+    if len(rk) == RANKING_PAGE_SIZE and pc3.button("次へ ▶", key="rank_next"):
+        st.session_state["rank_page"] = page + 1; st.rerun()
+    me = get_my_weekly_rank(user['username'])
+    if me: pc2.markdown(f"<div style='text-align:center;'>あなたの順位: <b>{me['rank']}位</b> ({int(me['duration_minutes'])} min)</div>", unsafe_allow_html=True)
+    else: pc2.caption("今週の記録はまだありません")
+
+# --- ショップ ---
+def render_shop(user):
+    st.subheader("🛒 ショップ")
+
+    c_bgm, c_other = st.columns(2)
+
+    with c_bgm:
+        st.markdown("#### 🎵 BGM購入")
+        for b, p in CATALOG["bgms"][1:]:
+            with st.container(border=True):
+                bc1, bc2 = st.columns([0.6, 0.4])
+                bc1.write(f"**{b}**")
+                bc1.caption(f"{p} G")
+                if not owns(user, "bgms", b):
+                    if bc2.button("購入", key=f"buy_bgm_{b}"):
+                        if user['coins'] >= p:
+                            try: bought = purchase_item(user['username'], "bgms", b)
+                            except: st.error("購入に失敗しました")
+                            else:
+                                if bought is None: st.error("不足")
+                                else: push_effect("balloons"); st.rerun()
+                        else: st.error("不足")
+                else: bc2.write("✅ 済")
+
+    with c_other:
+        st.markdown("#### 🅰️ フォント")
+        for f, p in CATALOG["themes"][1:]:
+            with st.container(border=True):
+                fc1, fc2 = st.columns([0.6,0.4])
+                fc1.write(f"**{f}**")
+                fc1.caption(f"{p} G")
+                if not owns(user, "themes", f):
+                    if fc2.button("購入", key=f"buy_{f}"):
+                        if user['coins']>=p and purchase_item(user['username'], "themes", f) is not None:
+                            push_effect("balloons"); st.rerun()
+                        else: st.error("不足")
+                else: fc2.write("✅ 済")
+
+        st.divider()
+
+        st.markdown("#### 🖼️ 壁紙")
+        for w, p in CATALOG["wallpapers"][1:]:
+            with st.container(border=True):
+                wc1, wc2 = st.columns([0.6,0.4])
+                wc1.write(f"**{w}**")
+                wc1.caption(f"{p} G")
+                if not owns(user, "wallpapers", w):
+                    if wc2.button("購入", key=f"buy_w_{w}"):
+                        if user['coins']>=p and purchase_item(user['username'], "wallpapers", w) is not None:
+                            push_effect("balloons"); st.rerun()
+                        else: st.error("不足")
+                else: wc2.write("✅ 済")
+
+        st.divider()
+        st.markdown("#### 🎲 称号ガチャ")
+        with st.container(border=True):
+            st.write(f"**ランダム称号ガチャ (1回 {GACHA_PRICE} G)**")
+            if st.button("ガチャを回す", type="primary"):
+                got = random.choice([t for t, _ in CATALOG["titles"][1:]])
+                granted = purchase_item(user['username'], "titles", got) if user['coins'] >= GACHA_PRICE else None
+                if granted is None: st.error("コイン不足")
+                else:
+                    push_effect("toast", f"🎉 新しい称号「{got}」を獲得！" if granted else f"かぶり！「{got}」だった...")
+                    push_effect("balloons"); st.rerun()
+
+# --- 科目 ---
+def render_subjects(user):
+    warn_if_failed("科目", "subjects", user['username'])
+    ns = st.text_input("新規科目")
+    if st.button("追加", key="add_sub"):
+        if ns: add_subject_db(user['username'], ns); st.rerun()
+    for s in get_subjects(user['username']):
+        c1, c2 = st.columns([0.8, 0.2])
+        c1.write(s)
+        if c2.button("削除", key=f"del_s_{s}"): delete_subject_db(user['username'], s); st.rerun()
+
+# --- データ入出力 ---
+def render_data(user):
+    st.subheader("📤 エクスポート")
+    for table, spec in data_io.TABLES.items():
+        c1, c2, c3 = st.columns([0.4, 0.3, 0.3])
+        c1.write(f"**{spec['label']}**")
+        for col, fmt in ((c2, "csv"), (c3, "json")):
+            col.download_button(
+                fmt.upper(), data=functools.partial(data_io.export_file, supabase, table, user['username'], fmt),
+                file_name=f"{table}_{jst_today()}.{fmt}", mime=data_io.MIME[fmt],
+                key=f"export_{table}_{fmt}", on_click="ignore", use_container_width=True)
+
+    st.divider()
+    st.subheader("📥 インポート")
+    result = st.session_state.pop("import_result", None)
+    if result:
+        n, errors = result
+        if n: st.success(f"{n}件を取り込みました")
+        if errors:
+            st.warning(f"{len(errors)}行をスキップしました")
+            st.dataframe(pd.DataFrame(errors[:100], columns=["行", "理由"]), hide_index=True)
+    table = st.radio("種類", list(data_io.TABLES), format_func=lambda t: data_io.TABLES[t]['label'], horizontal=True, key="import_table")
+    st.caption("エクスポートしたファイルと同じ列 (CSV はヘッダー行付き、JSON はオブジェクトの配列) で読み込めます。勉強ログ分のXP・コインは取り込み後にまとめて付与されます。")
+    up = st.file_uploader("CSV / JSON", type=["csv", "json"], key="import_file")
+    if up and st.button("取り込む", type="primary"):
+        try: records = data_io.read_records(up.getvalue(), up.name)
+        except Exception as e: st.error(f"ファイルを読み込めません: {e}"); return
+        rows, errors = data_io.validate(table, records, jst_today())
+        try: n = import_records(user['username'], table, rows) if rows else 0
+        except: st.error("取り込みの途中で失敗しました。取り込み済みの行は残っています"); return
+        st.session_state["import_result"] = (n, errors)
+        st.rerun()
+
+# --- 画面切り替え (表示中のビューだけを実行する) ---
+VIEWS = {
+    "📅 カレンダー": render_calendar,
+    "⏱️ タイマー": render_timer,
+    "📊 分析": render_analysis,
+    "🏆 ランキング": render_ranking,
+    "🛒 ショップ": render_shop,
+    "📚 科目": render_subjects,
+    "💾 データ": render_data,
+}
+
+def _sync_view_param():
+    st.query_params["view"] = st.session_state["view"]
+    flush_prefs(st.session_state["username"], force=True)
+
+# 各ビューが使うデータ。再実行の先頭で FetchPlan に足して、ユーザー行などと同時に取得する
+def calendar_needs(plan):
+    if st.session_state.get("cal_mode", CAL_MODES[0]) == CAL_MODES[0]:
+        window, sel = nav_window(), selected_day()
+        plan.add("day_totals", *window).add("tasks", *window).add("logs", sel, sel, None)
+    else: plan.add("tasks", *month_window()[:2]).add("logs", *month_window())
+
+VIEW_NEEDS = {
+    "📅 カレンダー": lambda plan: calendar_needs(plan),
+    "⏱️ タイマー": lambda plan: plan.add("subjects").add("logs", None, None, 5),
+    "📊 分析": lambda plan: plan.add("history"),
+    "🏆 ランキング": lambda plan: plan.call(get_weekly_ranking, RANKING_PAGE_SIZE, st.session_state.get("rank_page", 0) * RANKING_PAGE_SIZE).call(get_my_weekly_rank, plan.username),
+    "📚 科目": lambda plan: plan.add("subjects"),
+}
+
+def current_view():
+    if st.session_state.get("view") not in VIEWS:
+        q = st.query_params.get("view")
+        st.session_state["view"] = q if q in VIEWS else next(iter(VIEWS))
+    return st.session_state["view"]
+
+def render_view(user):
+    current_view()
+    view = st.radio("表示", list(VIEWS), key="view", horizontal=True, label_visibility="collapsed", on_change=_sync_view_param)
+    with profiler.section(f"view:{view}"):
+        VIEWS[view](user)
+
+def render_debug_panel(prof):
+    s = prof.summary()
+    with st.sidebar.expander("🔧 プロファイル", expanded=True):
+        st.caption(f"合計 {s['total_ms']} ms / DB {s['db_calls']}回 {s['db_ms']} ms / {s['rows']}行")
+        fp = st.session_state.get("_first_paint")
+        if fp: st.caption(f"初回描画 ({fp['view']}) {fp['first_paint_ms']} ms / import {fp['import_ms']} ms / 読み込み済み: {', '.join(fp['loaded']) or 'なし'}")
+        if s['sections']: st.dataframe(pd.DataFrame(list(s['sections'].items()), columns=["区間", "ms"]), hide_index=True)
+        if s['queries']: st.dataframe(pd.DataFrame(s['queries']), hide_index=True)
+        for r in s['repeated']: st.warning(f"同じクエリが{r['count']}回: {r['table']} {r['shape']}")
+
+def render_status_bar(user):
+    warn_if_failed("今日の勉強記録", "totals", user['username'], jst_today())
+    today_mins = get_today_minutes(user['username'])
+
+    st.markdown(f"""
+    <div class="status-bar">
+        <div class="stat-item"><div class="stat-label">PLAYER</div><div class="stat-val" style="font-size:1.2em;">{user['nickname']}</div><div style="font-size:0.7em;">{user.get('current_title', '見習い')}</div></div>
+        <div class="stat-item"><div class="stat-label">XP</div><div class="stat-val" style="color:{user.get('accent_color')};">{user['xp']}</div></div>
+        <div class="stat-item"><div class="stat-label">COIN</div><div class="stat-val" style="color:{user.get('accent_color')};">{user['coins']} <span class="stat-unit">G</span></div></div>
+        <div class="stat-item"><div class="stat-label">TODAY</div><div class="stat-val" style="color:{user.get('accent_color')};">{today_mins} <span class="stat-unit">/ {user.get('daily_goal')} min</span></div></div>
+    </div>
+    """, unsafe_allow_html=True)
+    st.progress(min(1.0, today_mins / max(1, user.get('daily_goal', 60))))
+
+# --- メイン処理 ---
+def mark_first_paint(view):
+    """セッションで最初の画面を出し終えた時点 (それまでの要素はブラウザへ送信済み) を記録する。"""
+    if "_first_paint" in st.session_state: return
+    started, import_ms = st.session_state["_session_started"]
+    st.session_state["_first_paint"] = {
+        "view": view, "import_ms": import_ms, "first_paint_ms": round((time.perf_counter() - started) * 1000, 1),
+        "loaded": [m for m in HEAVY_MODULES if m in sys.modules],
+    }
+    if profiling_enabled(): profiler.startup(**st.session_state["_first_paint"])
+
+def main():
+    st.session_state["_fetch_errors"] = {}
+    st.session_state.setdefault("_session_started", (_SCRIPT_STARTED, _IMPORT_MS))
+    with profiler.rerun("main", enabled=profiling_enabled(), user=st.session_state.get("username", "")) as prof:
+        render_app()
+    mark_first_paint("app")
+    if not st.session_state.get("logged_in"): prewarm_modules()
+    if prof and st.query_params.get("debug") == "1": render_debug_panel(prof)
+
+def render_app():
+    if "logged_in" not in st.session_state: 
+        st.session_state.update({
+            "logged_in": False, "username": "",
+            "selected_date": str(jst_today()),
+            "cal_year": jst_today().year, "cal_month": jst_today().month,
+            "selected_bgm": "なし"
+        })
+
+    if not st.session_state["logged_in"]:
+        st.title("🛡️ ログイン")
+        mode = st.selectbox("モード", ["ログイン", "新規登録"])
+        u = st.text_input("ユーザーID"); p = st.text_input("パスワード", type="password")
+        if mode == "新規登録":
+            n = st.text_input("ニックネーム")
+            if st.button("登録"):
+                res, msg = add_user(u, p, n)
+                if res: st.success(msg)
+                else: st.error(msg)
+        else:
+            if st.button("ログイン"):
+                res, msg = login_user(u, p)
+                if res:
+                    epoch = (get_user_data(u) or {}).get('session_epoch', 0)
+                    if cookie_login_enabled():
+                        # 直後の st.rerun() でこの再実行の描画は捨てられるので、書き込みはログイン後の描画で行う
+                        token = make_session_token(u, epoch)
+                        st.session_state["_auth_cookie"] = {"token": token, "key": f"auth_cookie_{hashlib.sha256(token.encode()).hexdigest()[:12]}",
+                                                            "expires_at": datetime.now() + timedelta(days=SESSION_DAYS)}
+                    st.session_state.update({"logged_in": True, "username": u, "_token_epoch": epoch, "_logged_out": False}); st.rerun()
+                else: st.error(msg)
+
+        # ログインフォームを先に描画してから Cookie を読む (値はコンポーネントから届いた後の再実行で入る)
+        mark_first_paint("login")
+        if cookie_login_enabled() and not st.session_state.get("_logged_out"):
+            restored = verify_session_token(get_cookie_manager().get(AUTH_COOKIE))
+            if restored:
+                st.session_state.update({"logged_in": True, "username": restored[0], "_token_epoch": restored[1]}); st.rerun()
+        return
+
+    write_auth_cookie()
+    apply_outbox_results(st.session_state["username"])
+    plan = FetchPlan(st.session_state["username"]).add("user").add("session").add("totals", jst_today())
+    # 計測中はビューを描画しないので、そのデータも取りに行かない (ログイン直後などセッションが未取得なら一緒に取る)
+    if not _cache_get(("session", st.session_state["username"])): VIEW_NEEDS.get(current_view(), lambda plan: None)(plan)
+    with profiler.section("fetch"): plan.run()
+
+    user = get_user_data(st.session_state["username"])
+    if fetch_failed("user", st.session_state["username"]):
+        st.error("ユーザー情報を読み込めませんでした。しばらくしてから再読み込みしてください"); return
+    if not user or user.get('session_epoch', 0) != st.session_state.get("_token_epoch", 0):
+        st.session_state["logged_in"] = False; st.session_state["_logged_out"] = True; st.rerun()
+    user.update(st.session_state.get("_pending_prefs", {}))
+    flush_prefs(user['username'])
+
+    if not user.get('current_wallpaper'):
+        try: update_user(user['username'], {"current_wallpaper": "真っ白"})
+        except: pass
+
+    today_str = str(jst_today())
+    if user.get('last_login_date') != today_str:
+        # 受け取れなかった場合は last_login_date が変わらないので、次の再実行で再び受け取りを試みる
+        try:
+            if claim_login_bonus(user['username']): push_effect("toast", "🎁 ログインボーナス！ +100コイン GET！", icon="🎁")
+        except FETCH_ERRORS: st.warning("ログインボーナスを受け取れませんでした。しばらくしてから再読み込みしてください")
+
+    with profiler.section("design"):
+        apply_design(
+            user.get('current_theme', '標準'), 
+            user.get('current_wallpaper', '真っ白'),
+            user.get('main_text_color', '#000000'),
+            user.get('accent_color', '#FFD700')
+        )
+
+    # サイドバー
+    with st.sidebar, profiler.section("sidebar"):
+        st.subheader("⚙️ 設定")
+        
+        st.markdown("##### 🎵 集中時のBGM (YouTube)")
+        my_bgms = ["なし"] + owned_items(user, "bgms")
+        
+        selected_bgm = st.selectbox("再生する音", my_bgms, index=0, key="bgm_select")
+        st.session_state["selected_bgm"] = selected_bgm
+
+        with st.expander("👑 称号装備"):
+            my_titles = owned_items(user, "titles")
+            cur_t = user.get('current_title', '見習い')
+            st.selectbox("称号", my_titles, index=my_titles.index(cur_t) if cur_t in my_titles else 0,
+                         key="pref_title", on_change=_on_pref_change, args=("current_title", "pref_title"))
+
+        with st.expander("🖼️ 壁紙"):
+            my_walls = owned_items(user, "wallpapers")
+            cur_w = user.get('current_wallpaper', '真っ白')
+            st.selectbox("壁紙", my_walls, index=my_walls.index(cur_w) if cur_w in my_walls else 0,
+                         key="pref_wallpaper", on_change=_on_pref_change, args=("current_wallpaper", "pref_wallpaper"))
+
+        with st.expander("🎨 文字色"):
+            cur_m = user.get('main_text_color', '#000000'); cur_a = user.get('accent_color', '#FFD700')
+            st.color_picker("メイン", cur_m, key="pref_main_color", on_change=_on_pref_change, args=("main_text_color", "pref_main_color"))
+            st.color_picker("アクセント", cur_a, key="pref_accent_color", on_change=_on_pref_change, args=("accent_color", "pref_accent_color"))
+        
+        st.divider()
+        st.number_input("1日の目標(分)", value=user.get('daily_goal', 60), step=10,
+                        key="pref_goal", on_change=_on_pref_change, args=("daily_goal", "pref_goal"))
+        
+        st.divider()
+        
+        my_fonts = owned_items(user, "themes")
+        cur_font = user.get('current_theme', '標準')
+        if cur_font not in my_fonts: cur_font = "標準"
+        st.selectbox("フォント", my_fonts, index=my_fonts.index(cur_font),
+                     key="pref_font", on_change=_on_pref_change, args=("current_theme", "pref_font"))
+
+        if st.session_state.get("_pending_prefs"): pref_flusher(user['username'])
+        queued = pending_study_logs(user['username'])
+        if queued:
+            st.caption(f"☁️ 送信待ちの記録 {len(queued)}件 (接続が回復すると自動で送信します)")
+            outbox_watcher(user['username'])
+        failed = failed_study_logs(user['username'])
+        if failed:
+            st.warning(f"⚠️ 送信できなかった記録 {len(failed)}件 ({sum(r['minutes'] for r in failed)}分)")
+            fc1, fc2 = st.columns(2)
+            if fc1.button("再送", key="retry_failed_logs"):
+                get_outbox().retry_failed(user['username']); st.rerun()
+            if fc2.button("破棄", key="discard_failed_logs"):
+                get_outbox().discard_failed(user['username']); st.rerun()
+
+        if st.button("ログアウト"):
+            flush_prefs(user['username'], force=True)
+            if cookie_login_enabled():
+                try: get_cookie_manager().delete(AUTH_COOKIE)
+                except KeyError: pass
+                st.session_state.pop("_auth_cookie", None)
+            revoke_sessions(user['username'])
+            invalidate_cache(user['username'])
+            for k in [k for k in st.session_state if k.startswith("pref_")]: del st.session_state[k]
+            st.session_state["logged_in"] = False; st.session_state["_logged_out"] = True; st.rerun()
+
+    drain_effects()
+
+    # ★ 集中モード (BGM再生)。計測中のセッションはDBから読むため、別のレプリカや再起動後でも続きから表示される
+    session = get_active_session(user['username'])
+    if session:
+        st.empty()
+        
+        if session.get("started_at"):
+            s_bgm = st.session_state.get("selected_bgm", "なし")
+            if s_bgm in BGM_URLS:
+                st.video(BGM_URLS[s_bgm], autoplay=True)
+                st.caption(f"🎵 再生中: {s_bgm}")
+        else:
+            st.warning("⏸ 一時停止中（BGM停止）")
+
+        st.markdown(f"<h1 style='text-align:center;'>🔥 {session.get('subject', '')} 中...</h1>", unsafe_allow_html=True)
+        show_timer_fragment(user['username'], "#ffffff" if user.get('current_wallpaper') == "真っ黒" else user.get('main_text_color', '#000000'))
+        return
+
+    with profiler.section("status_bar"): render_status_bar(user)
+
+    render_view(user)
+
+if __name__ == "__main__":
+    main()
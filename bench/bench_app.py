@@ -0,0 +1,268 @@
+"""app.py の関数・画面単位のベンチマークと、1操作あたりのDB往復回数の上限チェック。
+
+    python -m bench.bench_app
+    python -m bench.bench_app --sizes 10 10000 1000000 --latency 0.02
+
+FakeSupabase に 10件 / 1万件 / 100万件 の勉強ログを投入し、
+add_study_log・get_weekly_ranking・get_study_logs・カレンダー描画・日付クリック・main() の再実行を計測する。
+BUDGETS の往復回数を超えた操作が1つでもあれば終了コード1で終わる。
+"""
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import supabase as supabase_pkg
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from bench.fake_supabase import FakeSupabase
+import outbox
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+BENCH_USER = "bench"
+SUBJECTS = ["数学", "英語", "国語", "理科", "社会"]
+JST = timezone(timedelta(hours=9))
+
+
+def jst_today():
+    # app.py と同じく日本時間の「今日」で投入する (ログインボーナス等の判定をずらさない)
+    return datetime.now(JST).date()
+
+# 操作名 -> DB往復回数の上限
+BUDGETS = {
+    "rerun (変更なし)": 0,
+    "main() 初回 (カレンダー)": 6,  # ユーザー・計測中セッション・今日の合計・前後数か月の日別合計・タスク・選択日ログ (FetchPlan で同時に取得)
+    "カレンダー日付クリック": 1,  # 選択日のログだけ (日別合計・タスクは読み込み済み)
+    "add_study_log": 1,
+    "queue_study_log": 0,
+    "outbox flush (100件)": 1,
+    "delete_study_log": 1,
+    "complete_task": 1,
+    "purchase_item": 1,
+    "import_records (1,000件)": 3,
+    "get_weekly_ranking": 1,
+    "記録フォーム送信 + 再描画": 3,
+    "ランキング表示に切替": 2,  # 表示ページと自分の順位 (どちらもプロセス全体でキャッシュ)
+}
+
+DB = FakeSupabase()
+
+
+def seed(db, n_logs, n_users=100, days=730):
+    """BENCH_USER に約半数、残りを他ユーザーに割り振ったログを投入する。"""
+    db.clear()
+    today = jst_today()
+    rnd = random.Random(n_logs)
+    users = [BENCH_USER] + [f"user{i}" for i in range(n_users)]
+    db.seed("users", [{
+        "username": u, "password": hashlib.sha256(b"pw").hexdigest(), "nickname": u, "xp": 0, "coins": 100000,
+        "current_theme": "標準", "current_title": "見習い", "current_wallpaper": "真っ白", "current_bgm": "なし",
+        "themes_mask": 1, "titles_mask": 1, "wallpapers_mask": 1, "bgms_mask": 1,
+        "daily_goal": 60, "main_text_color": "#000000", "accent_color": "#FFD700",
+        "last_login_date": str(today), "session_epoch": 0,
+    } for u in users])
+    db.seed("subjects", [{"username": BENCH_USER, "subject_name": s} for s in SUBJECTS])
+    db.seed("study_logs", ({
+        "username": BENCH_USER if i % 2 == 0 else rnd.choice(users[1:]),
+        "subject": rnd.choice(SUBJECTS), "duration_minutes": rnd.randint(5, 120),
+        "study_date": str(today - timedelta(days=rnd.randrange(days))),
+        "created_at": f"{today - timedelta(days=days)}T00:00:00+00:00",
+    } for i in range(n_logs)))
+    db.seed("tasks", [{
+        "username": BENCH_USER, "task_name": f"task{i}", "status": "未完了" if i % 3 else "完了",
+        "due_date": str(today + timedelta(days=rnd.randrange(-60, 30))), "priority": "中",
+    } for i in range(max(10, n_logs // 100))])
+    db.reset_calls()
+
+
+def load_app():
+    """app.py をモジュールとして読み込み、DB接続を DB に差し替える。"""
+    import app
+    app.supabase = DB
+    return app
+
+
+def reset_session():
+    for k in list(st.session_state): del st.session_state[k]
+    st.cache_data.clear()
+
+
+def measure(fn, reps):
+    """(中央値ミリ秒, 1回あたりの往復回数) を返す。"""
+    times, trips = [], []
+    for _ in range(reps):
+        DB.reset_calls()
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+        trips.append(DB.round_trips())
+    return statistics.median(times), max(trips)
+
+
+def new_app_test():
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.secrets["supabase"] = {"url": "http://fake", "key": "fake"}
+    at.secrets["auth"] = {"secret": "bench"}
+    at.run()
+    at.session_state["logged_in"] = True
+    at.session_state["username"] = BENCH_USER
+    at.session_state["_token_epoch"] = 0
+    return at
+
+
+def _check(at):
+    if at.exception: raise RuntimeError(at.exception[0].value)
+
+
+def bench_functions(app, reps):
+    results = {}
+    reset_session()
+    today = jst_today()
+    month = (today.replace(day=1), today)
+
+    def logs_full():
+        st.session_state.pop("_db_cache", None)
+        app.get_study_logs(BENCH_USER)
+    results["get_study_logs (全件)"] = measure(logs_full, reps)
+
+    def logs_month():
+        st.session_state.pop("_db_cache", None)
+        app.get_study_logs(BENCH_USER, *month)
+    results["get_study_logs (表示月)"] = measure(logs_month, reps)
+
+    def ranking():
+        st.cache_data.clear()
+        app.get_weekly_ranking()
+    results["get_weekly_ranking"] = measure(ranking, reps)
+
+    results["add_study_log"] = measure(lambda: app.add_study_log(BENCH_USER, "数学", 25, today), reps)
+
+    # 送信スレッドを動かさない待ち行列に差し替え、記録と送信を別々に測る
+    box = outbox.Outbox(os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"), app._send_study_logs)
+    app.get_outbox = lambda: box
+    app.get_user_data(BENCH_USER)
+    results["queue_study_log"] = measure(lambda: app.queue_study_log(BENCH_USER, "数学", 25, today), reps)
+    def flush_100():
+        for _ in range(100 - len(box.pending(BENCH_USER))): box.enqueue(BENCH_USER, "数学", 1, today, today)
+        DB.reset_calls()
+        box.flush()
+    results["outbox flush (100件)"] = measure(flush_100, reps)
+    log_ids = [r["id"] for r in DB.tables["study_logs"] if r["username"] == BENCH_USER][-reps:]
+    results["delete_study_log"] = measure(lambda: app.delete_study_log(log_ids.pop(), BENCH_USER), reps)
+    task_ids = [r["id"] for r in DB.tables["tasks"] if r["status"] == "未完了"][:reps]
+    results["complete_task"] = measure(lambda: app.complete_task(task_ids.pop(), BENCH_USER), reps)
+    results["purchase_item"] = measure(lambda: app.purchase_item(BENCH_USER, "titles", "努力家"), reps)
+    rows = [{"subject": "数学", "duration_minutes": 30, "study_date": str(today)}] * 1000
+    results["import_records (1,000件)"] = measure(lambda: app.import_records(BENCH_USER, "study_logs", rows), reps)
+    return results
+
+
+def bench_screens(reps):
+    results = {}
+    st.cache_data.clear()
+
+    def cold_main():
+        at = new_app_test()
+        DB.reset_calls()
+        t0 = time.perf_counter()
+        at.run()
+        _check(at)
+        return (time.perf_counter() - t0) * 1000, DB.round_trips(), at
+
+    runs = [cold_main() for _ in range(reps)]
+    results["main() 初回 (カレンダー)"] = (statistics.median(r[0] for r in runs), max(r[1] for r in runs))
+    at = runs[-1][2]
+
+    def rerun():
+        at.run()
+        _check(at)
+    results["rerun (変更なし)"] = measure(rerun, reps)
+
+    def calendar_cold():
+        at.session_state["_db_cache"] = {}
+        at.run()
+        _check(at)
+    results["カレンダー描画 (キャッシュ無し)"] = measure(calendar_cold, reps)
+
+    days = iter(range(1, 29))
+
+    def click_day():
+        # コンポーネントのクリックはウィジェット値として届く (AppTest からは session_state 経由で渡す)
+        day = jst_today().replace(day=next(days))
+        at.session_state["month_calendar"] = {"callback": "dateClick", "dateClick": {"allDay": True, "date": f"{day}T00:00:00.000Z"}}
+        at.run()
+        _check(at)
+    results["カレンダー日付クリック"] = measure(click_day, reps)
+
+    def submit_log():
+        at.radio(key="view").set_value("⏱️ タイマー").run()
+        DB.reset_calls()
+        [n for n in at.number_input if n.label == "分"][0].set_value(15)
+        [t for t in at.text_input if t.label == "科目"][0].input("英語")
+        [b for b in at.button if b.label == "記録"][0].click().run()
+        _check(at)
+    times, trips = [], []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        submit_log()
+        times.append((time.perf_counter() - t0) * 1000)
+        trips.append(DB.round_trips())
+    results["記録フォーム送信 + 再描画"] = (statistics.median(times), max(trips))
+
+    def to_ranking():
+        st.cache_data.clear()
+        at.radio(key="view").set_value("📅 カレンダー").run()
+        DB.reset_calls()
+        at.radio(key="view").set_value("🏆 ランキング").run()
+        _check(at)
+    times, trips = [], []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        to_ranking()
+        times.append((time.perf_counter() - t0) * 1000)
+        trips.append(DB.round_trips())
+    results["ランキング表示に切替"] = (statistics.median(times), max(trips))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 10000], help="投入する勉強ログ件数 (例: 10 10000 1000000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="1往復あたりに注入する遅延 (秒)")
+    parser.add_argument("--reps", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    DB.latency = args.latency
+    os.environ.setdefault("LOGTASK_OUTBOX", os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"))
+    supabase_pkg.create_client = lambda url, key: DB
+    app = load_app()
+    st.cache_resource.clear()  # 読み込み時に secrets 無しで作られた接続を捨て、AppTest 側でも DB を使わせる
+    failures = []
+    for n in args.sizes:
+        seed(DB, n)
+        results = bench_functions(app, args.reps)
+        seed(DB, n)
+        results.update(bench_screens(args.reps))
+        print(f"\n=== study_logs {n:,} 件 (latency {args.latency * 1000:.0f} ms) ===")
+        print(f"{'操作':<28}{'中央値(ms)':>12}{'往復':>6}{'上限':>6}")
+        for name, (ms, trips) in results.items():
+            budget = BUDGETS.get(name)
+            mark = ""
+            if budget is not None and trips > budget:
+                mark = "  ← 上限超過"
+                failures.append(f"{name} ({n:,} 件): {trips} > {budget}")
+            print(f"{name:<28}{ms:>12.1f}{trips:>6}{'' if budget is None else budget:>6}{mark}")
+    if failures:
+        print("\nDB往復回数の上限を超えた操作があります:\n  " + "\n  ".join(failures))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""app.py が使う Supabase クライアントのメモリ上の代替 (ベンチマーク・負荷試験用)。
+
+table().select().eq().gte().or_().order().insert().update().delete().execute() のチェーンと、
+supabase/migrations/ で定義しているDB関数 (rpc) を同じ意味で実装する。
+execute() 1回を1往復として数え、latency 秒の遅延を注入できる。
+"""
+import itertools
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+
+class FakeResponse:
+    def __init__(self, data): self.data = data
+
+
+def _cmp_key(v):
+    # 数値は数値として、それ以外 (日付文字列・タイムスタンプ) は文字列として比較する
+    if isinstance(v, bool) or v is None: return (0, str(v))
+    if isinstance(v, (int, float)): return (1, v)
+    return (2, str(v))
+
+
+def _cmp(a, b):
+    if isinstance(a, (int, float)) and isinstance(b, str):
+        try: b = type(a)(b)
+        except ValueError: pass
+    if isinstance(b, (int, float)) and isinstance(a, str):
+        try: a = type(b)(a)
+        except ValueError: pass
+    ka, kb = _cmp_key(a), _cmp_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+def _split_top(expr):
+    """PostgREST の or/and 式をカッコの外のカンマで分ける。"""
+    parts, depth, cur = [], 0, ""
+    for ch in expr:
+        if ch == "," and depth == 0: parts.append(cur); cur = ""; continue
+        depth += (ch == "(") - (ch == ")")
+        cur += ch
+    return parts + [cur] if cur else parts
+
+
+_OPS = {"eq": lambda c: c == 0, "neq": lambda c: c != 0, "gt": lambda c: c > 0, "gte": lambda c: c >= 0, "lt": lambda c: c < 0, "lte": lambda c: c <= 0}
+
+
+def _condition(expr):
+    """"col.op.value" / "and(...)" / "or(...)" を行 -> bool の関数にする。"""
+    for name, combine in (("and(", all), ("or(", any)):
+        if expr.startswith(name):
+            preds = [_condition(e) for e in _split_top(expr[len(name):-1])]
+            return lambda r: combine(p(r) for p in preds)
+    col, op, value = expr.split(".", 2)
+    return lambda r: r.get(col) is not None and _OPS[op](_cmp(r.get(col), value))
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self.op, self.payload, self.columns = "select", None, "*"
+        self.filters, self.orders = [], []
+        self.user_eq = None
+        self.limit_n, self.range_ab, self.on_conflict = None, None, "id"
+
+    # --- 操作 ---
+    def select(self, columns="*", **kwargs): self.op, self.columns = "select", columns; return self
+    def insert(self, payload, **kwargs): self.op, self.payload = "insert", payload; return self
+    def upsert(self, payload, on_conflict="id", **kwargs): self.op, self.payload, self.on_conflict = "upsert", payload, on_conflict; return self
+    def update(self, payload, **kwargs): self.op, self.payload = "update", payload; return self
+    def delete(self, **kwargs): self.op = "delete"; return self
+
+    # --- フィルタ ---
+    def _add(self, col, pred):
+        self.filters.append(lambda r: r.get(col) is not None and pred(r.get(col)))
+        return self
+
+    def eq(self, col, v):
+        if col == "username": self.user_eq = v
+        return self._add(col, lambda x: _cmp(x, v) == 0)
+    def neq(self, col, v): return self._add(col, lambda x: _cmp(x, v) != 0)
+    def gt(self, col, v): return self._add(col, lambda x: _cmp(x, v) > 0)
+    def gte(self, col, v): return self._add(col, lambda x: _cmp(x, v) >= 0)
+    def lt(self, col, v): return self._add(col, lambda x: _cmp(x, v) < 0)
+    def lte(self, col, v): return self._add(col, lambda x: _cmp(x, v) <= 0)
+    def in_(self, col, values): return self._add(col, lambda x: any(_cmp(x, v) == 0 for v in values))
+    def or_(self, filters, **kwargs): self.filters.append(_condition(f"or({filters})")); return self
+
+    def order(self, col, desc=False, **kwargs): self.orders.append((col, desc)); return self
+    def limit(self, n, **kwargs): self.limit_n = n; return self
+    def range(self, start, end, **kwargs): self.range_ab = (start, end); return self
+
+    def _match(self, row): return all(f(row) for f in self.filters)
+
+    def _project(self, rows):
+        if self.columns.strip() == "*": return [dict(r) for r in rows]
+        cols = [c.strip() for c in self.columns.split(",")]
+        return [{c: r.get(c) for c in cols} for r in rows]
+
+    def execute(self):
+        return self.db._execute(self.table, self.op, self)
+
+
+class FakeRpc:
+    def __init__(self, db, fn, params): self.db, self.fn, self.params = db, fn, params or {}
+    def execute(self): return self.db._execute("rpc:" + self.fn, "rpc", self)
+
+
+class FakeSupabase:
+    """スレッドセーフなメモリ上のDB。calls に (対象, 操作) を記録する。"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = defaultdict(list)
+        self._by_user = defaultdict(lambda: defaultdict(list))
+        self._ids = itertools.count(1)
+        self._totals = {}
+        self._lock = threading.RLock()
+        self.calls = []
+
+    # --- クライアントAPI ---
+    def table(self, name): return FakeQuery(self, name)
+    def rpc(self, fn, params=None): return FakeRpc(self, fn, params)
+
+    # --- テスト用 ---
+    def seed(self, table, rows):
+        with self._lock:
+            for r in rows: self._insert_row(table, r)
+
+    def clear(self):
+        with self._lock:
+            self.tables.clear()
+            self._by_user.clear()
+            self._totals.clear()
+            self.calls = []
+
+    def reset_calls(self):
+        with self._lock: self.calls = []
+
+    def round_trips(self): return len(self.calls)
+
+    # --- 内部 ---
+    def _insert_row(self, table, row):
+        r = dict(row)
+        if "id" in r: self._ids = itertools.count(max(next(self._ids), int(r["id"]) + 1))  # 実DBと同様に id を単調増加に保つ
+        else: r["id"] = next(self._ids)
+        r.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        self.tables[table].append(r)
+        if "username" in r: self._by_user[table][r["username"]].append(r)
+        if table == "study_logs": self._bump_total(r["username"], r["study_date"], r["duration_minutes"])
+        return r
+
+    def _bump_total(self, username, study_date, minutes):
+        # daily_study_totals の維持 (DB側のトリガー bump_daily_study_total と同じ)
+        key = (username, str(study_date)[:10])
+        row = self._totals.get(key)
+        if row is None:
+            row = self._totals[key] = {"username": username, "study_date": key[1], "minutes": 0}
+            self.tables["daily_study_totals"].append(row)
+            self._by_user["daily_study_totals"][username].append(row)
+        row["minutes"] += minutes
+
+    def _total(self, username, day): return (self._totals.get((username, str(day))) or {}).get("minutes", 0)
+
+    def _remove_rows(self, table, rows):
+        ids = {id(r) for r in rows}
+        self.tables[table] = [r for r in self.tables[table] if id(r) not in ids]
+        for r in rows:
+            if "username" in r:
+                bucket = self._by_user[table][r["username"]]
+                bucket[:] = [x for x in bucket if id(x) not in ids]
+            if table == "study_logs": self._bump_total(r["username"], r["study_date"], -r["duration_minutes"])
+
+    def _candidates(self, table, q):
+        if q.user_eq is not None: return self._by_user[table].get(q.user_eq, [])
+        return self.tables[table]
+
+    def _execute(self, target, op, q):
+        if self.latency: time.sleep(self.latency)
+        with self._lock:
+            self.calls.append((target, op))
+            if op == "rpc":
+                return FakeResponse(getattr(self, "rpc_" + q.fn)(**q.params))
+            if op == "insert":
+                items = q.payload if isinstance(q.payload, list) else [q.payload]
+                return FakeResponse([dict(self._insert_row(target, it)) for it in items])
+            if op == "upsert":
+                keys = [k.strip() for k in q.on_conflict.split(",")]
+                out = []
+                for it in (q.payload if isinstance(q.payload, list) else [q.payload]):
+                    hit = next((r for r in self.tables[target] if all(_cmp(r.get(k), it.get(k)) == 0 for k in keys)), None)
+                    if hit: hit.update(it); out.append(dict(hit))
+                    else: out.append(dict(self._insert_row(target, it)))
+                return FakeResponse(out)
+            rows = [r for r in self._candidates(target, q) if q._match(r)]
+            if op == "update":
+                for r in rows: r.update(q.payload)
+                return FakeResponse([dict(r) for r in rows])
+            if op == "delete":
+                self._remove_rows(target, rows)
+                return FakeResponse([dict(r) for r in rows])
+            for col, desc in reversed(q.orders):
+                rows = sorted(rows, key=lambda r: _cmp_key(r.get(col)), reverse=desc)
+            if q.range_ab: rows = rows[q.range_ab[0]:q.range_ab[1] + 1]
+            if q.limit_n is not None: rows = rows[:q.limit_n]
+            return FakeResponse(q._project(rows))
+
+    def _user(self, username):
+        rows = self._by_user["users"].get(username)
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _public(user): return {k: v for k, v in user.items() if k != "password"} if user else None
+
+    # --- DB関数 (supabase/migrations/ と同じ意味) ---
+    def _weekly_totals(self, since):
+        totals = defaultdict(int)
+        for r in self.tables["daily_study_totals"]:
+            if _cmp(r["study_date"], since) >= 0: totals[r["username"]] += r["minutes"]
+        ordered = sorted(((u, m) for u, m in totals.items() if m > 0), key=lambda kv: (-kv[1], kv[0]))
+        out = []
+        for i, (u, m) in enumerate(ordered):
+            rank = out[-1]["rank"] if out and out[-1]["duration_minutes"] == m else i + 1
+            user = self._user(u) or {}
+            out.append({"rank": rank, "username": u, "nickname": user.get("nickname"), "current_title": user.get("current_title"), "duration_minutes": m})
+        return out
+
+    def rpc_weekly_leaderboard(self, p_since, p_limit=10, p_offset=0):
+        return self._weekly_totals(p_since)[p_offset:p_offset + p_limit]
+
+    def rpc_my_weekly_rank(self, p_username, p_since):
+        return [{"rank": r["rank"], "duration_minutes": r["duration_minutes"]} for r in self._weekly_totals(p_since) if r["username"] == p_username]
+
+    def rpc_log_study(self, p_username, p_subject, p_minutes, p_study_date, p_today, p_goal_bonus=100):
+        u = self._user(p_username)
+        if not u: return {"ok": False}
+        log = self._insert_row("study_logs", {"username": p_username, "subject": p_subject, "duration_minutes": p_minutes, "study_date": p_study_date})
+        total = self._total(p_username, p_today)
+        reached = u.get("last_goal_reward_date") != p_today and total >= (u.get("daily_goal") or 60)
+        u["xp"] += p_minutes
+        u["coins"] += p_minutes + (p_goal_bonus if reached else 0)
+        if reached: u["last_goal_reward_date"] = p_today
+        return {"ok": True, "log_id": log["id"], "goal_reached": reached, "today_minutes": total, "user": self._public(u)}
+
+    def rpc_log_study_batch(self, p_username, p_entries, p_goal_bonus=100):
+        u = self._user(p_username)
+        if not u: return {"ok": False}
+        seen = {r.get("client_id") for r in self._by_user["study_logs"][p_username]}
+        added, reached_days = 0, 0
+        for e in p_entries:
+            if e["client_id"] in seen: continue  # on conflict (client_id) do nothing
+            seen.add(e["client_id"])
+            self._insert_row("study_logs", {"username": p_username, "subject": e["subject"], "duration_minutes": e["minutes"], "study_date": e["study_date"], "client_id": e["client_id"]})
+            added += e["minutes"]
+            total = self._total(p_username, e["today"])
+            if u.get("last_goal_reward_date") != e["today"] and total >= (u.get("daily_goal") or 60):
+                u["last_goal_reward_date"] = e["today"]
+                reached_days += 1
+        u["xp"] += added
+        u["coins"] += added + p_goal_bonus * reached_days
+        return {"ok": True, "goal_reached": reached_days > 0, "user": self._public(u)}
+
+    def rpc_remove_study_log(self, p_username, p_id):
+        u = self._user(p_username)
+        hit = [r for r in self._by_user["study_logs"][p_username] if _cmp(r["id"], p_id) == 0]
+        if not hit: return {"ok": False, "user": self._public(u)}
+        self._remove_rows("study_logs", hit)
+        m = hit[0]["duration_minutes"]
+        u["xp"], u["coins"] = max(0, u["xp"] - m), max(0, u["coins"] - m)
+        return {"ok": True, "user": self._public(u)}
+
+    def rpc_complete_task_reward(self, p_username, p_id, p_reward=10):
+        u = self._user(p_username)
+        hit = [r for r in self._by_user["tasks"][p_username] if _cmp(r["id"], p_id) == 0 and r["status"] == "未完了"]
+        if not hit: return {"ok": False, "user": self._public(u)}
+        hit[0]["status"] = "完了"
+        u["xp"] += p_reward
+        u["coins"] += p_reward
+        return {"ok": True, "user": self._public(u)}
+
+    def rpc_claim_login_bonus(self, p_username, p_today, p_bonus=100):
+        u = self._user(p_username)
+        if not u or u.get("last_login_date") == p_today: return {"ok": False, "user": self._public(u)}
+        u["coins"] += p_bonus
+        u["last_login_date"] = p_today
+        return {"ok": True, "user": self._public(u)}
+
+    def rpc_grant_import_reward(self, p_username, p_minutes):
+        u = self._user(p_username)
+        if not u: return {"ok": False}
+        u["xp"] += max(0, p_minutes)
+        u["coins"] += max(0, p_minutes)
+        return {"ok": True, "user": self._public(u)}
+
+    def _session_json(self, s):
+        elapsed = (s or {}).get("accumulated_seconds") or 0
+        if s and s.get("started_at"): elapsed += int((datetime.now(timezone.utc) - datetime.fromisoformat(s["started_at"])).total_seconds())
+        return {"ok": s is not None, "session": dict(s) if s else None, "elapsed_seconds": elapsed}
+
+    def _session(self, username):
+        rows = self._by_user["active_sessions"].get(username)
+        return rows[0] if rows else None
+
+    def rpc_start_session(self, p_username, p_subject):
+        s = self._session(p_username)
+        if s: return dict(self._session_json(s), existing=True)  # on conflict do nothing
+        s = self._insert_row("active_sessions", {"username": p_username})
+        s.update(subject=p_subject, started_at=datetime.now(timezone.utc).isoformat(), accumulated_seconds=0)
+        return self._session_json(s)
+
+    def rpc_pause_session(self, p_username):
+        s = self._session(p_username)
+        if s and s.get("started_at"):
+            s["accumulated_seconds"] = self._session_json(s)["elapsed_seconds"]
+            s["started_at"] = None
+        return self._session_json(s)
+
+    def rpc_resume_session(self, p_username):
+        s = self._session(p_username)
+        if s and not s.get("started_at"): s["started_at"] = datetime.now(timezone.utc).isoformat()
+        return self._session_json(s)
+
+    def rpc_stop_session(self, p_username):
+        s = self._session(p_username)
+        if s: self._remove_rows("active_sessions", [s])
+        return self._session_json(s)
+
+    def rpc_revoke_sessions(self, p_username):
+        u = self._user(p_username)
+        if not u: return None
+        u["session_epoch"] = u.get("session_epoch", 0) + 1
+        return u["session_epoch"]
+
+    def rpc_purchase_item(self, p_username, p_price, p_category, p_bit):
+        u = self._user(p_username)
+        if not u or u["coins"] < p_price: return {"ok": False, "user": self._public(u)}
+        col = p_category + "_mask"
+        owned = u.get(col) or 1
+        u["coins"] -= p_price
+        u[col] = owned | (1 << p_bit)
+        return {"ok": True, "granted": not owned >> p_bit & 1, "user": self._public(u)}
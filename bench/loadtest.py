@@ -0,0 +1,247 @@
+"""同時セッション数を変えた負荷試験 (1ホストで何人まで捌けるかの見積もり用)。
+
+    python -m bench.loadtest --sessions 20 --loops 3 --latency 0.02
+    python -m bench.loadtest --sessions 50 --json result.json
+
+FakeSupabase (遅延を注入可能) を相手に、N 個のセッションをスレッドで同時に動かす。
+各セッションは AppTest で app.py を実行し、ログイン → カレンダーの日付クリック (別の月を含む) →
+タイマー開始・終了 → ショップでガチャ → ランキング表示 のシナリオを --loops 回繰り返す。
+再実行ごとの所要時間の p50/p95/p99 (全体と操作別)、セッションあたりのCPU時間と常駐メモリ (RSS) を出力する。
+AppTest は run_every のフラグメントを自動では実行しないため、計測対象はユーザー操作による再実行のみ。
+"""
+import argparse
+import contextlib
+import gc
+import hashlib
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import supabase as supabase_pkg
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test as _app_test
+from streamlit.testing.v1 import local_script_runner as _local_runner
+
+from bench.bench_app import APP_PATH, SUBJECTS, jst_today
+from bench.fake_supabase import FakeSupabase
+
+DB = FakeSupabase()
+
+
+def seed(db, n_users, logs_per_user, days=365):
+    db.clear()
+    today = jst_today()
+    rnd = random.Random(n_users)
+    users = [f"load{i}" for i in range(n_users)]
+    db.seed("users", [{
+        "username": u, "password": hashlib.sha256(b"pw").hexdigest(), "nickname": u, "xp": 0, "coins": 10 ** 7,
+        "current_theme": "標準", "current_title": "見習い", "current_wallpaper": "真っ白", "current_bgm": "なし",
+        "themes_mask": 1, "titles_mask": 1, "wallpapers_mask": 1, "bgms_mask": 1,
+        "daily_goal": 60, "main_text_color": "#000000", "accent_color": "#FFD700",
+        "last_login_date": str(today), "session_epoch": 0,
+    } for u in users])
+    db.seed("subjects", [{"username": u, "subject_name": s} for u in users for s in SUBJECTS])
+    db.seed("study_logs", ({
+        "username": u, "subject": rnd.choice(SUBJECTS), "duration_minutes": rnd.randint(5, 120),
+        "study_date": str(today - timedelta(days=rnd.randrange(days))),
+    } for u in users for _ in range(logs_per_user)))
+    db.seed("tasks", ({
+        "username": u, "task_name": f"task{i}", "status": "未完了" if i % 3 else "完了",
+        "due_date": str(today + timedelta(days=rnd.randrange(-60, 30))), "priority": "中",
+    } for u in users for i in range(20)))
+    db.reset_calls()
+    return users
+
+
+@contextlib.contextmanager
+def shared_runtime(secrets):
+    """全セッションで1つの Runtime を共有する (実サーバーと同じく st.cache_* もプロセス内で共有される)。
+    AppTest は run() のたびにプロセス全体の Runtime・secrets・設定・スクリプトキャッシュを差し替えて戻すため、
+    そのままスレッドから同時に動かすと互いの実行を壊す。差し替え先をダミーにして、最初に1回だけ設定する。"""
+    from unittest.mock import MagicMock
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    script_cache = ScriptCache()
+    saved = Runtime._instance, st.secrets, _app_test.Runtime, _app_test.patch_config_options, _app_test.ScriptCache, _local_runner.ScriptCache
+    st.secrets = Secrets()
+    st.secrets._secrets = secrets
+    with _app_test.patch_config_options({"global.appTest": True}):
+        Runtime._instance = runtime
+        _app_test.Runtime = type("_PerRunRuntime", (Runtime,), {})
+        _app_test.patch_config_options = lambda options: contextlib.nullcontext()
+        _app_test.ScriptCache = _local_runner.ScriptCache = lambda: script_cache  # コンパイル済みのスクリプトも共有する
+        try: yield runtime
+        finally: (Runtime._instance, st.secrets, _app_test.Runtime, _app_test.patch_config_options,
+                  _app_test.ScriptCache, _local_runner.ScriptCache) = saved
+
+
+def rss_bytes():
+    """現在の常駐メモリ。/proc が無い環境では最大常駐メモリで代用する。"""
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class Session:
+    """1人分のブラウザタブ。step() で1操作 (= 1回の再実行) を行い、所要時間を記録する。"""
+
+    def __init__(self, username, samples, think, rnd):
+        self.username, self.samples, self.think, self.rnd = username, samples, think, rnd
+        self.at = AppTest.from_file(APP_PATH, default_timeout=600)
+        self.errors = 0
+
+    def step(self, name, action=None):
+        if self.think: time.sleep(self.rnd.uniform(0, self.think))
+        t0 = time.perf_counter()
+        try:
+            if action: action(self.at)
+            self.at.run()
+            if self.at.exception: raise RuntimeError(self.at.exception[0].value)
+        except Exception as e:
+            self.errors += 1
+            print(f"[{self.username}] {name}: {e!r}", file=sys.stderr)
+            return
+        self.samples[name].append((time.perf_counter() - t0) * 1000)
+
+    def _button(self, label=None, key=None):
+        return lambda at: (at.button(key=key) if key else next(b for b in at.button if b.label == label)).click()
+
+    def _date_click(self, day):
+        # カレンダーコンポーネントのクリックはウィジェット値として届く
+        return lambda at: at.session_state.__setitem__("month_calendar", {"callback": "dateClick", "dateClick": {"allDay": True, "date": f"{day}T00:00:00.000Z"}})
+
+    def _view(self, view):
+        return lambda at: at.radio(key="view").set_value(view)
+
+    def login(self):
+        self.step("表示 (未ログイン)")
+        def submit(at):
+            at.text_input[0].input(self.username)
+            at.text_input[1].input("pw")
+            next(b for b in at.button if b.label == "ログイン").click()
+        self.step("ログイン", submit)
+
+    def scenario(self):
+        self.step("カレンダー表示", self._view("📅 カレンダー"))
+        # 月移動はブラウザ内で完結するので、サーバーに届くのは別の月の日付を選んだときだけ
+        day = jst_today().replace(day=self.rnd.randint(1, 28))
+        self.step("日付クリック", self._date_click(day))
+        self.step("翌月の日付クリック", self._date_click((day.replace(day=1) + timedelta(days=31)).replace(day=day.day)))
+        self.step("今月に戻る", self._date_click(day))
+        self.step("タイマー表示", self._view("⏱️ タイマー"))
+        self.step("タイマー開始", self._button("スタート"))
+        self.step("一時停止", self._button("⏸ 一時停止"))
+        self.step("タイマー終了", self._button("⏹️ 終了"))
+        self.step("ショップ表示", self._view("🛒 ショップ"))
+        self.step("ガチャ", self._button("ガチャを回す"))
+        self.step("ランキング表示", self._view("🏆 ランキング"))
+
+
+def percentiles(values):
+    if len(values) < 2: return {"p50": values[0], "p95": values[0], "p99": values[0]} if values else {}
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
+
+
+def warm_up(username):
+    """初回だけかかる import・モジュール読み込みを、セッションごとの計測に含めないために1周だけ動かす。"""
+    s = Session(username, defaultdict(list), 0, random.Random(0))
+    s.login()
+    s.scenario()
+
+
+def run(n_sessions, loops, think, seed_value=0):
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    sessions = []
+    gc.collect()
+    DB.reset_calls()
+    rss0, cpu0, t0 = rss_bytes(), time.process_time(), time.perf_counter()
+
+    def worker(i, username):
+        local = defaultdict(list)
+        s = Session(username, local, think, random.Random(seed_value + i))
+        s.login()
+        for _ in range(loops): s.scenario()
+        with lock:
+            sessions.append(s)  # 全員が終わるまで AppTest を保持し、セッション分のメモリを残す
+            for k, v in local.items(): samples[k].extend(v)
+
+    threads = [threading.Thread(target=worker, args=(i, f"load{i}"), name=f"loadtest-{i}") for i in range(n_sessions)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall, cpu, rss1 = time.perf_counter() - t0, time.process_time() - cpu0, rss_bytes()
+    reruns = sum(len(v) for v in samples.values())
+    return {
+        "sessions": n_sessions, "loops": loops, "latency_ms": DB.latency * 1000, "think_s": think,
+        "wall_s": round(wall, 2), "reruns": reruns, "reruns_per_s": round(reruns / wall, 1) if wall else None,
+        "errors": sum(s.errors for s in sessions),
+        "db_round_trips": DB.round_trips(),
+        "rerun_ms": {k: round(v, 1) for k, v in percentiles([x for v in samples.values() for x in v]).items()},
+        "steps": {name: {"count": len(v), **{k: round(x, 1) for k, x in percentiles(v).items()}} for name, v in samples.items()},
+        "cpu_s_per_session": round(cpu / n_sessions, 3),
+        "cpu_ms_per_rerun": round(cpu * 1000 / reruns, 1) if reruns else None,
+        "rss_mb_before": round(rss0 / 2 ** 20, 1),
+        "rss_mb_after": round(rss1 / 2 ** 20, 1),
+        "rss_mb_per_session": round((rss1 - rss0) / 2 ** 20 / n_sessions, 2),
+    }
+
+
+def report(r):
+    print(f"\n=== {r['sessions']} セッション × {r['loops']} 周 (latency {r['latency_ms']:.0f} ms, 思考時間 最大 {r['think_s']} 秒) ===")
+    print(f"経過 {r['wall_s']} 秒 / 再実行 {r['reruns']} 回 ({r['reruns_per_s']} 回/秒) / DB往復 {r['db_round_trips']} 回 / エラー {r['errors']} 件")
+    print(f"{'操作':<20}{'回数':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, s in r["steps"].items():
+        print(f"{name:<20}{s['count']:>6}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}")
+    a = r["rerun_ms"]
+    print(f"{'全体':<20}{r['reruns']:>6}{a['p50']:>10.1f}{a['p95']:>10.1f}{a['p99']:>10.1f}")
+    print(f"CPU: 1セッションあたり {r['cpu_s_per_session']} 秒 / 1再実行あたり {r['cpu_ms_per_rerun']} ms")
+    print(f"RSS: {r['rss_mb_before']} MB → {r['rss_mb_after']} MB (1セッションあたり {r['rss_mb_per_session']} MB)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10], help="同時セッション数 (複数指定で順に実行)")
+    parser.add_argument("--loops", type=int, default=2, help="1セッションがシナリオを繰り返す回数")
+    parser.add_argument("--latency", type=float, default=0.02, help="1往復あたりに注入する遅延 (秒)")
+    parser.add_argument("--think", type=float, default=0.2, help="操作間の思考時間の最大値 (秒)")
+    parser.add_argument("--logs", type=int, default=500, help="1ユーザーあたりの勉強ログ件数")
+    parser.add_argument("--json", help="結果を JSON で書き出すパス (回帰比較用)")
+    args = parser.parse_args(argv)
+
+    DB.latency = args.latency
+    os.environ.setdefault("LOGTASK_OUTBOX", os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"))
+    supabase_pkg.create_client = lambda url, key: DB
+    results = []
+    with shared_runtime({"supabase": {"url": "http://fake", "key": "fake"}, "auth": {"secret": "bench"}}):
+        for n in args.sessions:
+            seed(DB, n, args.logs)
+            if not results:
+                warm_up("load0")
+                seed(DB, n, args.logs)
+            results.append(run(n, args.loops, args.think))
+            report(results[-1])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""コールドスタートの計測 (新しいプロセスでログイン画面を出すまで)。
+
+    python -m bench.startup
+    python -m bench.startup --runs 10 --budget-ms 300
+
+毎回新しい Python プロセスで app.py を1回実行し、app.py が LOGTASK_PROFILE=1 のときに出す
+起動レポート (import 時間・最初の描画までの時間・読み込み済みの重いモジュール) を集計する。
+ログイン画面の描画までに pandas / altair などを読み込んでいる、または中央値が --budget-ms を超えると終了コード1。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bench.bench_app import APP_PATH
+
+_CHILD = """
+import sys
+import supabase
+from bench.fake_supabase import FakeSupabase
+supabase.create_client = lambda url, key: FakeSupabase()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.secrets["supabase"] = {"url": "http://fake", "key": "fake"}
+at.secrets["auth"] = {"secret": "bench"}
+at.run()
+if at.exception: raise SystemExit(at.exception[0].value)
+"""
+
+
+def run_once():
+    env = dict(os.environ, LOGTASK_PROFILE="1")
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", _CHILD, APP_PATH], env=env, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    wall = (time.perf_counter() - t0) * 1000
+    if out.returncode: raise RuntimeError(out.stderr[-2000:])
+    report = next(json.loads(line) for line in out.stderr.splitlines() if line.startswith('{"startup"'))
+    return dict(report, process_ms=round(wall, 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=500, help="最初の描画までの中央値の上限 (ミリ秒)")
+    args = parser.parse_args(argv)
+
+    runs = [run_once() for _ in range(args.runs)]
+    print(f"{'回':>3}{'import(ms)':>12}{'初回描画(ms)':>14}{'プロセス全体(ms)':>18}  読み込み済み")
+    for i, r in enumerate(runs, 1):
+        print(f"{i:>3}{r['import_ms']:>12.1f}{r['first_paint_ms']:>14.1f}{r['process_ms']:>18.1f}  {', '.join(r['loaded']) or '-'}")
+    paint = statistics.median(r["first_paint_ms"] for r in runs)
+    print(f"中央値: import {statistics.median(r['import_ms'] for r in runs):.1f} ms / 初回描画 {paint:.1f} ms")
+    failures = [f"{i}回目: ログイン画面の描画前に {', '.join(r['loaded'])} を読み込んでいます" for i, r in enumerate(runs, 1) if r["loaded"]]
+    if paint > args.budget_ms: failures.append(f"初回描画の中央値 {paint:.1f} ms > {args.budget_ms:.0f} ms")
+    if failures:
+        print("\n" + "\n".join(failures))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
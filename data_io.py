@@ -0,0 +1,117 @@
+"""勉強ログ・タスクのエクスポート / インポート。
+
+エクスポートは id 順のキーセットページングで PAGE_SIZE 行ずつ読み、
+一時ファイル (一定サイズを超えるとディスクに退避) へ CSV / JSON として書き出す。
+インポートは1行ずつ検証してから BATCH_SIZE 行単位でまとめて insert する。
+"""
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+
+PAGE_SIZE = 1000
+BATCH_SIZE = 500
+SPOOL_BYTES = 8 * 1024 * 1024
+
+# テーブル -> 表示名・入出力する列 (id と username は出力しない / インポート時に付け直す)
+TABLES = {
+    "study_logs": {"label": "勉強ログ", "columns": ["subject", "duration_minutes", "study_date", "created_at"]},
+    "tasks": {"label": "タスク", "columns": ["task_name", "status", "due_date", "priority"]},
+}
+MIME = {"csv": "text/csv", "json": "application/json"}
+TASK_STATUSES = ("未完了", "完了")
+TASK_PRIORITIES = ("高", "中", "低")
+
+
+# --- エクスポート ---
+def iter_rows(client, table, username, page_size=PAGE_SIZE):
+    """username の行を id 順に page_size 行ずつ取得して1行ずつ返す。"""
+    columns = ",".join(["id"] + TABLES[table]["columns"])
+    last_id = 0
+    while True:
+        rows = client.table(table).select(columns).eq("username", username).gt("id", last_id).order("id").limit(page_size).execute().data
+        for r in rows: yield r
+        if len(rows) < page_size: return
+        last_id = rows[-1]["id"]
+
+
+def export_file(client, table, username, fmt):
+    """CSV (BOM付き UTF-8) または JSON 配列を書き込んだ一時ファイルを先頭に戻して返す。"""
+    columns = TABLES[table]["columns"]
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode="w+", encoding="utf-8", newline="")
+    if fmt == "csv":
+        out.write("\ufeff")
+        writer = csv.DictWriter(out, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for r in iter_rows(client, table, username): writer.writerow(r)
+    else:
+        out.write("[")
+        for i, r in enumerate(iter_rows(client, table, username)):
+            out.write(("," if i else "") + "\n" + json.dumps({c: r.get(c) for c in columns}, ensure_ascii=False))
+        out.write("\n]\n")
+    out.seek(0)
+    return out
+
+
+# --- インポート ---
+def _date(v, name):
+    try: return date.fromisoformat(str(v).strip()[:10])
+    except ValueError: raise ValueError(f"{name} は YYYY-MM-DD 形式にしてください") from None
+
+
+def _minutes(v):
+    try: return int(float(v))
+    except (TypeError, ValueError): raise ValueError("duration_minutes が数値ではありません") from None
+    except OverflowError: raise ValueError("duration_minutes は1〜1440の整数にしてください") from None
+
+
+def _log_row(r, today):
+    subject = str(r.get("subject") or "").strip()
+    if not subject or len(subject) > 50: raise ValueError("subject が空か50文字を超えています")
+    minutes = _minutes(r.get("duration_minutes"))
+    if not 1 <= minutes <= 1440: raise ValueError("duration_minutes は1〜1440の整数にしてください")
+    d = _date(r.get("study_date"), "study_date")
+    if d > today: raise ValueError("study_date が未来の日付です")
+    row = {"subject": subject, "duration_minutes": minutes, "study_date": str(d)}
+    if r.get("created_at"):
+        try: row["created_at"] = datetime.fromisoformat(str(r["created_at"]).strip()).isoformat()
+        except ValueError: raise ValueError("created_at が ISO 8601 形式ではありません") from None
+    return row
+
+
+def _task_row(r, today):
+    name = str(r.get("task_name") or "").strip()
+    if not name or len(name) > 200: raise ValueError("task_name が空か200文字を超えています")
+    status = str(r.get("status") or "未完了").strip()
+    if status not in TASK_STATUSES: raise ValueError(f"status は {'/'.join(TASK_STATUSES)} のいずれかにしてください")
+    priority = str(r.get("priority") or "中").strip()
+    if priority not in TASK_PRIORITIES: raise ValueError(f"priority は {'/'.join(TASK_PRIORITIES)} のいずれかにしてください")
+    return {"task_name": name, "status": status, "due_date": str(_date(r.get("due_date"), "due_date")), "priority": priority}
+
+
+VALIDATORS = {"study_logs": _log_row, "tasks": _task_row}
+
+
+def read_records(data, filename):
+    """アップロードされたバイト列を (行番号, dict) のリストにする。形式が壊れていれば ValueError。"""
+    if filename.lower().endswith(".json"):
+        records = json.loads(data.decode("utf-8-sig"))
+        if not isinstance(records, list): raise ValueError("JSON は配列にしてください")
+        return list(enumerate(records, start=1))
+    return list(enumerate(csv.DictReader(io.StringIO(data.decode("utf-8-sig"))), start=2))
+
+
+def validate(table, records, today):
+    """(取り込める行, [(行番号, 理由), ...]) を返す。"""
+    check = VALIDATORS[table]
+    rows, errors = [], []
+    for line, r in records:
+        if not isinstance(r, dict): errors.append((line, "オブジェクトではありません")); continue
+        try: rows.append(check(r, today))
+        except (TypeError, ValueError, OverflowError) as e: errors.append((line, str(e) or "値が不正です"))
+    return rows, errors
+
+
+def batches(rows, size=BATCH_SIZE):
+    for i in range(0, len(rows), size): yield rows[i:i + size]
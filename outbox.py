@@ -0,0 +1,151 @@
+"""勉強ログの書き込み待ち行列 (アプリのホスト上の SQLite)。
+
+記録操作はローカルの SQLite に1行書くだけで戻り、バックグラウンドのスレッドが
+ユーザーごとにまとめて DB 関数 log_study_batch で Supabase に送る。
+失敗した行は指数バックオフで再送し、client_id で二重登録を防ぐため応答が失われても重複しない。
+DB関数が ok=false で拒否した行は捨てずに failed_at を付けて残し、画面側で再送か破棄を選ばせる。
+送信に成功するたびにユーザーごとの世代番号を進め、画面側はそれを見てキャッシュを破棄する。
+"""
+import contextlib
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+logger = logging.getLogger("logtask.outbox")
+
+BATCH_SIZE = 100
+POLL_INTERVAL = 5  # 秒。再送待ちの行を確認する間隔
+MAX_BACKOFF = 300  # 秒
+
+_SCHEMA = """
+create table if not exists pending_logs (
+    client_id text primary key,
+    username text not null,
+    subject text not null,
+    minutes integer not null,
+    study_date text not null,
+    today text not null,
+    created_at real not null,
+    attempts integer not null default 0,
+    next_at real not null default 0,
+    last_error text,
+    failed_at real
+);
+create index if not exists pending_logs_due on pending_logs (next_at);
+"""
+
+
+class Outbox:
+    def __init__(self, path, send=None):
+        """send(username, entries) は DB 関数の戻り値 (dict) を返すか、失敗時に例外を投げる。"""
+        self.path, self.send = path, send
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._generations = defaultdict(int)
+        self._notices = defaultdict(list)
+        self._thread = None
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+            if "failed_at" not in {r["name"] for r in db.execute("pragma table_info(pending_logs)")}:
+                db.execute("alter table pending_logs add column failed_at real")  # failed_at 導入前のファイル
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """1回の操作ごとの接続。ブロックを抜けるとコミット (例外時はロールバック) して閉じる。"""
+        with contextlib.closing(sqlite3.connect(self.path, timeout=10)) as db:
+            db.execute("pragma journal_mode=wal")
+            db.execute("pragma synchronous=normal")
+            db.row_factory = sqlite3.Row
+            with db: yield db
+
+    # --- 画面側 ---
+    def enqueue(self, username, subject, minutes, study_date, today):
+        client_id = str(uuid.uuid4())
+        with self._connect() as db:
+            db.execute("insert into pending_logs (client_id, username, subject, minutes, study_date, today, created_at) values (?, ?, ?, ?, ?, ?, ?)",
+                       (client_id, username, subject, int(minutes), str(study_date), str(today), time.time()))
+        self._wake.set()
+        return client_id
+
+    def pending(self, username):
+        """未送信の行 (新しい順)。拒否された行は含まない。"""
+        with self._connect() as db:
+            return [dict(r) for r in db.execute("select * from pending_logs where username = ? and failed_at is null order by created_at desc", (username,))]
+
+    def failed(self, username):
+        """DB関数に拒否され、送信を止めている行 (新しい順)。"""
+        with self._connect() as db:
+            return [dict(r) for r in db.execute("select * from pending_logs where username = ? and failed_at is not null order by created_at desc", (username,))]
+
+    def retry_failed(self, username):
+        """拒否された行を送信待ちに戻す。client_id は変えないので、登録済みだった行は重複しない。"""
+        with self._connect() as db:
+            db.execute("update pending_logs set failed_at = null, attempts = 0, next_at = 0 where username = ? and failed_at is not null", (username,))
+        self._wake.set()
+
+    def discard_failed(self, username):
+        with self._connect() as db:
+            db.execute("delete from pending_logs where username = ? and failed_at is not null", (username,))
+
+    def generation(self, username):
+        return self._generations[username]
+
+    def pop_notices(self, username):
+        with self._lock:
+            return self._notices.pop(username, [])
+
+    # --- 送信 ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="logtask-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            try: self.flush()
+            except Exception: logger.exception("outbox flush failed")
+
+    def flush(self):
+        """送信時刻を迎えた行をユーザーごとに BATCH_SIZE 行ずつ送る。送った行数を返す。"""
+        with self._connect() as db:
+            rows = [dict(r) for r in db.execute("select * from pending_logs where failed_at is null and next_at <= ? order by created_at", (time.time(),))]
+        by_user = defaultdict(list)
+        for r in rows: by_user[r["username"]].append(r)
+        sent = 0
+        for username, items in by_user.items():
+            for i in range(0, len(items), BATCH_SIZE):
+                sent += self._send_batch(username, items[i:i + BATCH_SIZE])
+        return sent
+
+    def _send_batch(self, username, items):
+        ids = [r["client_id"] for r in items]
+        try:
+            out = self.send(username, [{k: r[k] for k in ("client_id", "subject", "minutes", "study_date", "today")} for r in items]) or {}
+        except Exception as e:
+            self._retry_later(items, e)
+            return 0
+        with self._connect() as db:
+            if out.get("ok"):
+                db.executemany("delete from pending_logs where client_id = ?", [(i,) for i in ids])
+            else:
+                # ユーザーが存在しない等、自動の再送では通らない行。捨てずに残して画面側に知らせる
+                logger.error("outbox rejected %d rows for %s: %s", len(items), username, out)
+                db.executemany("update pending_logs set failed_at = ?, last_error = ? where client_id = ?",
+                               [(time.time(), str(out)[:500], i) for i in ids])
+        with self._lock:
+            self._generations[username] += 1
+            if out.get("ok"): self._notices[username].append(out)
+        return len(items) if out.get("ok") else 0
+
+    def _retry_later(self, items, error):
+        with self._connect() as db:
+            db.executemany("update pending_logs set attempts = attempts + 1, next_at = ?, last_error = ? where client_id = ?", [
+                (time.time() + min(MAX_BACKOFF, 2 ** r["attempts"]) * random.uniform(0.5, 1.5), str(error)[:500], r["client_id"])
+                for r in items])
@@ -0,0 +1,140 @@
+"""再実行ごとのプロファイラ (オプトイン)。
+
+Supabase の execute() を包んでテーブル・フィルタの形・所要時間・行数を記録し、
+画面の区間 (デザイン・ステータスバー・各ビュー・タイマー) の処理時間を測る。
+結果は再実行ごとに1行のJSONログ (logger "logtask.profile") として出力し、デバッグパネルにも表示する。
+セッションの最初の描画までの時間 (import を含む) も startup() で1行出す。
+"""
+import contextvars
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger("logtask.profile")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# 値を含まない引数 (列名) だけを記録するメソッド
+_SHAPE_METHODS = {"select", "eq", "neq", "gt", "gte", "lt", "lte", "in_", "is_", "order"}
+
+_current = contextvars.ContextVar("logtask_profile", default=None)
+_PROCESS_STARTED = time.perf_counter()  # このモジュールを最初に読み込んだ時刻 (プロセスで最初の再実行の開始とほぼ同じ)
+_cold = True
+
+
+class RerunProfile:
+    def __init__(self, name, **fields):
+        self.name, self.fields = name, fields
+        self.started = time.perf_counter()
+        self.total_ms = None
+        self.queries = []
+        self.sections = {}
+
+    def record_query(self, target, shape, ms, rows):
+        self.queries.append({"table": target, "shape": shape, "ms": round(ms, 1), "rows": rows})
+
+    def repeated_queries(self):
+        """同じ形のクエリが1回の再実行で複数回発行されたもの (N+1 の候補)。"""
+        counts = Counter((q["table"], q["shape"]) for q in self.queries)
+        return [{"table": t, "shape": s, "count": c} for (t, s), c in counts.items() if c > 1]
+
+    def summary(self):
+        return {
+            "rerun": self.name, **self.fields,
+            "total_ms": self.total_ms if self.total_ms is not None else round((time.perf_counter() - self.started) * 1000, 1),
+            "db_calls": len(self.queries),
+            "db_ms": round(sum(q["ms"] for q in self.queries), 1),
+            "rows": sum(q["rows"] for q in self.queries),
+            "sections": self.sections,
+            "queries": self.queries,
+            "repeated": self.repeated_queries(),
+        }
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def rerun(name, enabled=True, **fields):
+    """1回の再実行 (またはフラグメント実行) を計測し、終了時にJSONログを1行出す。"""
+    if not enabled:
+        yield None
+        return
+    prof = RerunProfile(name, **fields)
+    token = _current.set(prof)
+    try:
+        yield prof
+    finally:
+        prof.total_ms = round((time.perf_counter() - prof.started) * 1000, 1)
+        _current.reset(token)
+        logger.info(json.dumps(prof.summary(), ensure_ascii=False, default=str))
+
+
+def startup(**fields):
+    """セッションの最初の描画までの計測を1行のJSONで出す。プロセスで最初のセッションは cold (コールドスタート)。"""
+    global _cold
+    cold, _cold = _cold, False
+    record = {"startup": True, "cold": cold, **fields}
+    if cold: record["since_process_ms"] = round((time.perf_counter() - _PROCESS_STARTED) * 1000, 1)
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def section(name):
+    """名前付き区間の処理時間を現在のプロファイルに加算する。プロファイル無効時は何もしない。"""
+    prof = _current.get()
+    if prof is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.sections[name] = round(prof.sections.get(name, 0) + (time.perf_counter() - t0) * 1000, 1)
+
+
+class _ProfiledQuery:
+    def __init__(self, target, builder, shape=None):
+        self._target, self._builder, self._shape = target, builder, shape or []
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr): return attr
+
+        def call(*args, **kwargs):
+            arg = args[0] if name in _SHAPE_METHODS and args and isinstance(args[0], str) else ""
+            self._shape.append(f"{name}({arg})")
+            self._builder = attr(*args, **kwargs)
+            return self
+        return call
+
+    def execute(self):
+        prof = _current.get()
+        if prof is None: return self._builder.execute()
+        t0 = time.perf_counter()
+        res = self._builder.execute()
+        data = getattr(res, "data", None)
+        rows = len(data) if isinstance(data, list) else (1 if data else 0)
+        prof.record_query(self._target, " ".join(self._shape), (time.perf_counter() - t0) * 1000, rows)
+        return res
+
+
+class ProfiledClient:
+    """Supabase クライアントの table() / rpc() を包み、プロファイル有効時だけ execute() を記録する。"""
+
+    def __init__(self, client): self._client = client
+
+    def table(self, name): return _ProfiledQuery(name, self._client.table(name))
+    def rpc(self, fn, params=None): return _ProfiledQuery("rpc:" + fn, self._client.rpc(fn, params or {}), ["rpc()"])
+    def __getattr__(self, name): return getattr(self._client, name)
+
+
+def instrument(client):
+    return ProfiledClient(client) if client is not None else None
@@ -0,0 +1,36 @@
+-- 週間ランキングをDB側で集計し、上位N件 (ニックネーム・称号付き) と自分の順位だけを返す
+
+create index if not exists study_logs_study_date_idx
+    on study_logs (study_date) include (username, duration_minutes);
+
+create or replace function weekly_leaderboard(p_since date, p_limit int default 10, p_offset int default 0)
+returns table (rank bigint, username text, nickname text, current_title text, duration_minutes bigint)
+language sql stable as $$
+    with totals as (
+        select l.username, sum(l.duration_minutes)::bigint as duration_minutes
+        from study_logs l
+        where l.study_date >= p_since
+        group by l.username
+    )
+    select rank() over (order by t.duration_minutes desc), t.username, u.nickname, u.current_title, t.duration_minutes
+    from totals t left join users u on u.username = t.username
+    order by 1, t.username
+    limit p_limit offset p_offset;
+$$;
+
+create or replace function weekly_rank(p_username text, p_since date)
+returns table (rank bigint, username text, nickname text, current_title text, duration_minutes bigint)
+language sql stable as $$
+    with totals as (
+        select l.username, sum(l.duration_minutes)::bigint as duration_minutes
+        from study_logs l
+        where l.study_date >= p_since
+        group by l.username
+    ), ranked as (
+        select rank() over (order by t.duration_minutes desc) as rank, t.username, t.duration_minutes
+        from totals t
+    )
+    select r.rank, r.username, u.nickname, u.current_title, r.duration_minutes
+    from ranked r left join users u on u.username = r.username
+    where r.username = p_username;
+$$;
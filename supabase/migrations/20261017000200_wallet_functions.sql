@@ -0,0 +1,146 @@
+-- XP・コインの増減、目標ボーナス判定、アイテム解放を1回の呼び出しでアトミックに行う関数群
+-- いずれも users 行を FOR UPDATE でロックしてから更新するため、二重クリックや複数タブでも更新が失われない
+-- 戻り値は {"ok": bool, "user": users行 (password除く), ...} の jsonb
+
+create or replace function append_unlock(p_list text, p_item text)
+returns text
+language sql immutable as $$
+    select case
+        when p_item is null or p_item = any(string_to_array(coalesce(p_list, ''), ',')) then p_list
+        else concat_ws(',', nullif(p_list, ''), p_item)
+    end;
+$$;
+
+-- 勉強記録の追加 + XP/コイン付与 + 本日の目標達成ボーナス
+create or replace function log_study(p_username text, p_subject text, p_minutes int, p_study_date date, p_today date, p_goal_bonus int default 100)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+    log_id bigint;
+    total bigint;
+    reached boolean := false;
+begin
+    select * into u from users where username = p_username for update;
+    if not found then
+        return jsonb_build_object('ok', false);
+    end if;
+
+    insert into study_logs (username, subject, duration_minutes, study_date)
+    values (p_username, p_subject, p_minutes, p_study_date)
+    returning id into log_id;
+
+    select coalesce(sum(duration_minutes), 0) into total
+    from study_logs where username = p_username and study_date = p_today;
+
+    reached := u.last_goal_reward_date is distinct from p_today and total >= coalesce(u.daily_goal, 60);
+
+    update users set
+        xp = xp + p_minutes,
+        coins = coins + p_minutes + case when reached then p_goal_bonus else 0 end,
+        last_goal_reward_date = case when reached then p_today else last_goal_reward_date end
+    where username = p_username
+    returning * into u;
+
+    return jsonb_build_object('ok', true, 'log_id', log_id, 'goal_reached', reached, 'user', to_jsonb(u) - 'password');
+end;
+$$;
+
+-- 勉強記録の削除 + 付与済みXP/コインの回収 (0未満にはしない)
+create or replace function remove_study_log(p_username text, p_id bigint)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+    m int;
+begin
+    select * into u from users where username = p_username for update;
+    delete from study_logs where id = p_id and username = p_username returning duration_minutes into m;
+    if m is null then
+        return jsonb_build_object('ok', false, 'user', to_jsonb(u) - 'password');
+    end if;
+
+    update users set xp = greatest(0, xp - m), coins = greatest(0, coins - m)
+    where username = p_username
+    returning * into u;
+
+    return jsonb_build_object('ok', true, 'user', to_jsonb(u) - 'password');
+end;
+$$;
+
+-- タスク完了 + 報酬 (未完了のタスクに対して一度だけ)
+create or replace function complete_task_reward(p_username text, p_id bigint, p_reward int default 10)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+begin
+    select * into u from users where username = p_username for update;
+    update tasks set status = '完了' where id = p_id and username = p_username and status = '未完了';
+    if not found then
+        return jsonb_build_object('ok', false, 'user', to_jsonb(u) - 'password');
+    end if;
+
+    update users set xp = xp + p_reward, coins = coins + p_reward
+    where username = p_username
+    returning * into u;
+
+    return jsonb_build_object('ok', true, 'user', to_jsonb(u) - 'password');
+end;
+$$;
+
+-- ログインボーナス (1日1回)
+create or replace function claim_login_bonus(p_username text, p_today date, p_bonus int default 100)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+begin
+    update users set coins = coins + p_bonus, last_login_date = p_today
+    where username = p_username and last_login_date is distinct from p_today
+    returning * into u;
+    if not found then
+        select * into u from users where username = p_username;
+        return jsonb_build_object('ok', false, 'user', to_jsonb(u) - 'password');
+    end if;
+    return jsonb_build_object('ok', true, 'user', to_jsonb(u) - 'password');
+end;
+$$;
+
+-- コイン支払い + アイテム解放 (ショップ購入・ガチャ)。残高不足なら何も変更せず ok=false
+-- p_category: 'themes' | 'titles' | 'wallpapers' | 'bgms'
+create or replace function purchase_item(p_username text, p_price int, p_category text, p_item text)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+    owned text;
+begin
+    select * into u from users where username = p_username for update;
+    if not found or u.coins < p_price then
+        return jsonb_build_object('ok', false, 'user', to_jsonb(u) - 'password');
+    end if;
+
+    owned := case p_category
+        when 'themes' then u.unlocked_themes
+        when 'titles' then u.unlocked_titles
+        when 'wallpapers' then u.unlocked_wallpapers
+        when 'bgms' then u.unlocked_bgms
+    end;
+
+    update users set
+        coins = coins - p_price,
+        unlocked_themes = case when p_category = 'themes' then append_unlock(unlocked_themes, p_item) else unlocked_themes end,
+        unlocked_titles = case when p_category = 'titles' then append_unlock(unlocked_titles, p_item) else unlocked_titles end,
+        unlocked_wallpapers = case when p_category = 'wallpapers' then append_unlock(unlocked_wallpapers, p_item) else unlocked_wallpapers end,
+        unlocked_bgms = case when p_category = 'bgms' then append_unlock(unlocked_bgms, p_item) else unlocked_bgms end
+    where username = p_username
+    returning * into u;
+
+    return jsonb_build_object(
+        'ok', true,
+        'granted', not (p_item = any(string_to_array(coalesce(owned, ''), ','))),
+        'user', to_jsonb(u) - 'password'
+    );
+end;
+$$;
@@ -0,0 +1,2 @@
+-- Cookieのセッショントークン失効用。ログアウトのたびに +1 され、それ以前に発行したトークンは無効になる
+alter table users add column if not exists session_epoch int not null default 0;
@@ -0,0 +1,17 @@
+-- インポートした勉強ログ分の XP・コインを、取り込み後に1回だけまとめて付与する
+-- (1件ずつ log_study を呼ばないため、目標達成ボーナスの判定は行わない)
+create or replace function grant_import_reward(p_username text, p_minutes int)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+begin
+    update users set xp = xp + greatest(0, p_minutes), coins = coins + greatest(0, p_minutes)
+    where username = p_username
+    returning * into u;
+    if not found then
+        return jsonb_build_object('ok', false);
+    end if;
+    return jsonb_build_object('ok', true, 'user', to_jsonb(u) - 'password');
+end;
+$$;
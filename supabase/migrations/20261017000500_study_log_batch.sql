@@ -0,0 +1,50 @@
+-- アプリ側の書き込み待ち行列 (outbox.py) からまとめて送られる勉強ログの登録
+-- client_id は待ち行列で採番した UUID。再送しても同じ行は1度しか登録されず、報酬も1度だけ付与する
+
+alter table study_logs add column if not exists client_id uuid;
+create unique index if not exists study_logs_client_id_key on study_logs (client_id);
+
+-- p_entries: [{"client_id", "subject", "minutes", "study_date", "today"}, ...]
+-- 目標達成ボーナスは log_study と同じく、記録した日 (today) の合計で1日1回判定する
+create or replace function log_study_batch(p_username text, p_entries jsonb, p_goal_bonus int default 100)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+    e jsonb;
+    d date;
+    total bigint;
+    added int := 0;
+    reached_days int := 0;
+begin
+    select * into u from users where username = p_username for update;
+    if not found then
+        return jsonb_build_object('ok', false);
+    end if;
+
+    for e in select * from jsonb_array_elements(p_entries) loop
+        insert into study_logs (username, subject, duration_minutes, study_date, client_id)
+        values (p_username, e->>'subject', (e->>'minutes')::int, (e->>'study_date')::date, (e->>'client_id')::uuid)
+        on conflict (client_id) do nothing;
+        continue when not found;
+
+        added := added + (e->>'minutes')::int;
+        d := (e->>'today')::date;
+        select coalesce(sum(duration_minutes), 0) into total
+        from study_logs where username = p_username and study_date = d;
+        if u.last_goal_reward_date is distinct from d and total >= coalesce(u.daily_goal, 60) then
+            u.last_goal_reward_date := d;
+            reached_days := reached_days + 1;
+        end if;
+    end loop;
+
+    update users set
+        xp = xp + added,
+        coins = coins + added + p_goal_bonus * reached_days,
+        last_goal_reward_date = u.last_goal_reward_date
+    where username = p_username
+    returning * into u;
+
+    return jsonb_build_object('ok', true, 'goal_reached', reached_days > 0, 'user', to_jsonb(u) - 'password');
+end;
+$$;
@@ -0,0 +1,71 @@
+-- 解放済みアイテムをカンマ区切り文字列からカテゴリごとのビットマスクに移行する
+-- ビット位置は app.py の CATALOG の並び順 (先頭 = 初期所持品 = ビット0)。目録の正は app.py 側で、DB は位置しか知らない
+
+alter table users
+    add column if not exists themes_mask bigint not null default 1,
+    add column if not exists titles_mask bigint not null default 1,
+    add column if not exists wallpapers_mask bigint not null default 1,
+    add column if not exists bgms_mask bigint not null default 1;
+
+-- 既存データの移行 (この時点の目録の並び)
+create or replace function pg_temp.to_mask(p_list text, p_catalog text[])
+returns bigint
+language sql immutable as $$
+    select coalesce(bit_or(1::bigint << (c.i - 1)::int), 0) | 1
+    from unnest(p_catalog) with ordinality as c(name, i)
+    where c.name = any(string_to_array(coalesce(p_list, ''), ','));
+$$;
+
+update users set
+    themes_mask = pg_temp.to_mask(unlocked_themes, array['標準', 'ピクセル風', '手書き風', 'ポップ', '明朝体', '筆文字']),
+    titles_mask = pg_temp.to_mask(unlocked_titles, array['見習い', '駆け出し', '努力家', '集中王', '夜更かし', '天才', '覚醒者', '大賢者', '神童', 'マスター', 'レジェンド']),
+    wallpapers_mask = pg_temp.to_mask(unlocked_wallpapers, array['真っ白', '真っ黒', '夕焼け', '夜空', '草原']),
+    bgms_mask = pg_temp.to_mask(unlocked_bgms, array['Lofi', '雨音', 'カフェ', '森', 'ホワイトノイズ']);
+
+-- unlocked_* 列はアプリから参照しなくなった。ロールバックの必要が無くなったら drop してよい
+
+drop function if exists purchase_item(text, int, text, text);
+drop function if exists append_unlock(text, text);
+
+-- コイン支払い + 所持ビットの付与 (ショップ購入・ガチャ)。残高不足なら何も変更せず ok=false
+-- p_category: 'themes' | 'titles' | 'wallpapers' | 'bgms'、p_bit: 目録上の位置 (0〜62)
+create or replace function purchase_item(p_username text, p_price int, p_category text, p_bit int)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+    v_bit bigint;
+    owned bigint;
+begin
+    if p_bit < 0 or p_bit > 62 then
+        raise exception 'invalid item bit: %', p_bit;
+    end if;
+    v_bit := 1::bigint << p_bit;
+
+    select * into u from users where username = p_username for update;
+    if not found or u.coins < p_price then
+        return jsonb_build_object('ok', false, 'user', to_jsonb(u) - 'password');
+    end if;
+
+    owned := case p_category
+        when 'themes' then u.themes_mask
+        when 'titles' then u.titles_mask
+        when 'wallpapers' then u.wallpapers_mask
+        when 'bgms' then u.bgms_mask
+    end;
+    if owned is null then
+        raise exception 'unknown category: %', p_category;
+    end if;
+
+    update users set
+        coins = coins - p_price,
+        themes_mask = case when p_category = 'themes' then themes_mask | v_bit else themes_mask end,
+        titles_mask = case when p_category = 'titles' then titles_mask | v_bit else titles_mask end,
+        wallpapers_mask = case when p_category = 'wallpapers' then wallpapers_mask | v_bit else wallpapers_mask end,
+        bgms_mask = case when p_category = 'bgms' then bgms_mask | v_bit else bgms_mask end
+    where username = p_username
+    returning * into u;
+
+    return jsonb_build_object('ok', true, 'granted', owned & v_bit = 0, 'user', to_jsonb(u) - 'password');
+end;
+$$;
@@ -0,0 +1,5 @@
+-- カレンダーは「未完了のタスク全件 + 表示中の月に期日がある完了済みタスク」だけを読む
+-- 未完了分は部分インデックス、期日の範囲と完了済みの履歴ページングは (username, due_date) で引く
+
+create index if not exists tasks_open_due_idx on tasks (username, due_date) where status = '未完了';
+create index if not exists tasks_username_due_idx on tasks (username, due_date);
@@ -0,0 +1,86 @@
+-- 計測中の勉強セッション (1ユーザー1行)。タイマーの状態をサーバーのプロセスではなくDBに置き、
+-- どのレプリカに再接続しても・再起動しても続きから再開できるようにする
+-- 経過時間は accumulated_seconds + (now() - started_at)。一時停止中は started_at が null
+-- 書き込みは開始・一時停止・再開・終了の操作ごとに1回だけで、計測中に定期的な書き込みはしない
+
+create table if not exists active_sessions (
+    username text primary key references users (username) on delete cascade,
+    subject text not null,
+    started_at timestamptz,
+    accumulated_seconds int not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+-- 戻り値はいずれも {"ok": bool, "session": active_sessions行, "elapsed_seconds": int} の jsonb
+create or replace function session_json(s active_sessions)
+returns jsonb
+language sql stable as $$
+    select jsonb_build_object(
+        'ok', s.username is not null,
+        'session', to_jsonb(s),
+        'elapsed_seconds', coalesce(s.accumulated_seconds, 0) + coalesce(extract(epoch from now() - s.started_at)::int, 0)
+    );
+$$;
+
+-- 開始 (計測中のセッションがあれば新しい科目で最初からやり直す)
+create or replace function start_session(p_username text, p_subject text)
+returns jsonb
+language plpgsql as $$
+declare
+    s active_sessions%rowtype;
+begin
+    insert into active_sessions (username, subject, started_at, accumulated_seconds, updated_at)
+    values (p_username, p_subject, now(), 0, now())
+    on conflict (username) do update set
+        subject = excluded.subject, started_at = excluded.started_at,
+        accumulated_seconds = 0, updated_at = excluded.updated_at
+    returning * into s;
+    return session_json(s);
+end;
+$$;
+
+create or replace function pause_session(p_username text)
+returns jsonb
+language plpgsql as $$
+declare
+    s active_sessions%rowtype;
+begin
+    update active_sessions set
+        accumulated_seconds = accumulated_seconds + extract(epoch from now() - started_at)::int,
+        started_at = null, updated_at = now()
+    where username = p_username and started_at is not null
+    returning * into s;
+    if not found then
+        select * into s from active_sessions where username = p_username;
+    end if;
+    return session_json(s);
+end;
+$$;
+
+create or replace function resume_session(p_username text)
+returns jsonb
+language plpgsql as $$
+declare
+    s active_sessions%rowtype;
+begin
+    update active_sessions set started_at = now(), updated_at = now()
+    where username = p_username and started_at is null
+    returning * into s;
+    if not found then
+        select * into s from active_sessions where username = p_username;
+    end if;
+    return session_json(s);
+end;
+$$;
+
+-- 終了。行を削除し、確定した経過秒数を返す (勉強ログの登録はアプリ側の書き込み待ち行列が行う)
+create or replace function stop_session(p_username text)
+returns jsonb
+language plpgsql as $$
+declare
+    s active_sessions%rowtype;
+begin
+    delete from active_sessions where username = p_username returning * into s;
+    return session_json(s);
+end;
+$$;
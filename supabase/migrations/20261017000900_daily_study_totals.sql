@@ -0,0 +1,151 @@
+-- ユーザー×日 (study_date は JST の日付) ごとの勉強時間の合計。study_logs のトリガーで追加・削除・更新のたびに維持する
+-- 目標達成の判定・今日の合計 (ステータスバー)・週間ランキングは生のログを集計せず、この表を読む
+
+create table if not exists daily_study_totals (
+    username text not null,
+    study_date date not null,
+    minutes int not null default 0,
+    primary key (username, study_date)
+);
+create index if not exists daily_study_totals_date_idx on daily_study_totals (study_date) include (username, minutes);
+
+create or replace function bump_daily_study_total()
+returns trigger
+language plpgsql as $$
+begin
+    if tg_op in ('DELETE', 'UPDATE') then
+        update daily_study_totals set minutes = minutes - old.duration_minutes
+        where username = old.username and study_date = old.study_date;
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        insert into daily_study_totals (username, study_date, minutes)
+        values (new.username, new.study_date, new.duration_minutes)
+        on conflict (username, study_date) do update set minutes = daily_study_totals.minutes + excluded.minutes;
+    end if;
+    return null;
+end;
+$$;
+
+-- トリガー作成と既存ログの集計の間に書き込みが入って二重に数えないよう、移行中は書き込みを止める
+lock table study_logs in share row exclusive mode;
+
+drop trigger if exists study_logs_daily_total on study_logs;
+create trigger study_logs_daily_total
+    after insert or delete or update of username, study_date, duration_minutes on study_logs
+    for each row execute function bump_daily_study_total();
+
+insert into daily_study_totals (username, study_date, minutes)
+select username, study_date, sum(duration_minutes) from study_logs group by username, study_date
+on conflict (username, study_date) do update set minutes = excluded.minutes;
+
+-- 勉強記録の追加 (20261017000200 の置き換え)。今日の合計はトリガーが更新した行を1件読むだけ
+create or replace function log_study(p_username text, p_subject text, p_minutes int, p_study_date date, p_today date, p_goal_bonus int default 100)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+    log_id bigint;
+    total int;
+    reached boolean := false;
+begin
+    select * into u from users where username = p_username for update;
+    if not found then
+        return jsonb_build_object('ok', false);
+    end if;
+
+    insert into study_logs (username, subject, duration_minutes, study_date)
+    values (p_username, p_subject, p_minutes, p_study_date)
+    returning id into log_id;
+
+    select coalesce((select minutes from daily_study_totals where username = p_username and study_date = p_today), 0) into total;
+
+    reached := u.last_goal_reward_date is distinct from p_today and total >= coalesce(u.daily_goal, 60);
+
+    update users set
+        xp = xp + p_minutes,
+        coins = coins + p_minutes + case when reached then p_goal_bonus else 0 end,
+        last_goal_reward_date = case when reached then p_today else last_goal_reward_date end
+    where username = p_username
+    returning * into u;
+
+    return jsonb_build_object('ok', true, 'log_id', log_id, 'goal_reached', reached, 'today_minutes', total, 'user', to_jsonb(u) - 'password');
+end;
+$$;
+
+-- 書き込み待ち行列からのまとめて登録 (20261017000500 の置き換え)
+create or replace function log_study_batch(p_username text, p_entries jsonb, p_goal_bonus int default 100)
+returns jsonb
+language plpgsql as $$
+declare
+    u users%rowtype;
+    e jsonb;
+    d date;
+    total int;
+    added int := 0;
+    reached_days int := 0;
+begin
+    select * into u from users where username = p_username for update;
+    if not found then
+        return jsonb_build_object('ok', false);
+    end if;
+
+    for e in select * from jsonb_array_elements(p_entries) loop
+        insert into study_logs (username, subject, duration_minutes, study_date, client_id)
+        values (p_username, e->>'subject', (e->>'minutes')::int, (e->>'study_date')::date, (e->>'client_id')::uuid)
+        on conflict (client_id) do nothing;
+        continue when not found;
+
+        added := added + (e->>'minutes')::int;
+        d := (e->>'today')::date;
+        select coalesce((select minutes from daily_study_totals where username = p_username and study_date = d), 0) into total;
+        if u.last_goal_reward_date is distinct from d and total >= coalesce(u.daily_goal, 60) then
+            u.last_goal_reward_date := d;
+            reached_days := reached_days + 1;
+        end if;
+    end loop;
+
+    update users set
+        xp = xp + added,
+        coins = coins + added + p_goal_bonus * reached_days,
+        last_goal_reward_date = u.last_goal_reward_date
+    where username = p_username
+    returning * into u;
+
+    return jsonb_build_object('ok', true, 'goal_reached', reached_days > 0, 'user', to_jsonb(u) - 'password');
+end;
+$$;
+
+-- 週間ランキング (20261017000100 の置き換え)。1ユーザーあたり最大8行の日別合計から集計する
+create or replace function weekly_leaderboard(p_since date, p_limit int default 10, p_offset int default 0)
+returns table (rank bigint, username text, nickname text, current_title text, duration_minutes bigint)
+language sql stable as $$
+    with totals as (
+        select t.username, sum(t.minutes)::bigint as duration_minutes
+        from daily_study_totals t
+        where t.study_date >= p_since
+        group by t.username
+        having sum(t.minutes) > 0
+    )
+    select rank() over (order by t.duration_minutes desc), t.username, u.nickname, u.current_title, t.duration_minutes
+    from totals t left join users u on u.username = t.username
+    order by 1, t.username
+    limit p_limit offset p_offset;
+$$;
+
+create or replace function weekly_rank(p_username text, p_since date)
+returns table (rank bigint, username text, nickname text, current_title text, duration_minutes bigint)
+language sql stable as $$
+    with totals as (
+        select t.username, sum(t.minutes)::bigint as duration_minutes
+        from daily_study_totals t
+        where t.study_date >= p_since
+        group by t.username
+        having sum(t.minutes) > 0
+    ), ranked as (
+        select rank() over (order by t.duration_minutes desc) as rank, t.username, t.duration_minutes
+        from totals t
+    )
+    select r.rank, r.username, u.nickname, u.current_title, r.duration_minutes
+    from ranked r left join users u on u.username = r.username
+    where r.username = p_username;
+$$;
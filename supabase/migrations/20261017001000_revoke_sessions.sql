@@ -0,0 +1,9 @@
+-- ログアウト時のCookie失効。アプリ側のキャッシュ値から epoch + 1 を書くと、古い値や同時実行で epoch が進まないことがあるため
+-- DB側で session_epoch = session_epoch + 1 をアトミックに行う。戻り値は新しい session_epoch (ユーザーが無ければ null)
+create or replace function revoke_sessions(p_username text)
+returns int
+language sql as $$
+    update users set session_epoch = session_epoch + 1
+    where username = p_username
+    returning session_epoch;
+$$;
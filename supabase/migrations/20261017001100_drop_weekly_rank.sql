@@ -0,0 +1,3 @@
+-- 自分の順位はアプリ側でプロセスごとにキャッシュした全体の順位表 (weekly_leaderboard の limit なし) から引くようになったため、
+-- ユーザーごとに全員分を集計し直していた weekly_rank は削除する
+drop function if exists weekly_rank(text, date);
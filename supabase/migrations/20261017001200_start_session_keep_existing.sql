@@ -0,0 +1,19 @@
+-- 開始時に計測中のセッションがあれば上書きせずにそのまま返す ({"existing": true} 付き)。
+-- 古いタブで「スタート」を押しても、他のタブで計測中の開始時刻・累積時間が消えないようにする
+create or replace function start_session(p_username text, p_subject text)
+returns jsonb
+language plpgsql as $$
+declare
+    s active_sessions%rowtype;
+begin
+    insert into active_sessions (username, subject, started_at, accumulated_seconds, updated_at)
+    values (p_username, p_subject, now(), 0, now())
+    on conflict (username) do nothing
+    returning * into s;
+    if found then
+        return session_json(s);
+    end if;
+    select * into s from active_sessions where username = p_username;
+    return session_json(s) || jsonb_build_object('existing', true);
+end;
+$$;
@@ -0,0 +1,22 @@
+-- 自分の週間順位。順位表全体は作らず、自分の合計と「それより多く勉強したユーザー数」だけを数える
+-- (rank() と同じく同点は同順位)。daily_study_totals_date_idx (study_date include username, minutes) だけで済む
+-- 今週の記録が無ければ行を返さない
+create or replace function my_weekly_rank(p_username text, p_since date)
+returns table (rank bigint, duration_minutes bigint)
+language sql stable as $$
+    with mine as (
+        select sum(minutes)::bigint as total
+        from daily_study_totals
+        where username = p_username and study_date >= p_since
+    )
+    select (
+        select count(*) + 1 from (
+            select 1 from daily_study_totals
+            where study_date >= p_since
+            group by username
+            having sum(minutes) > m.total
+        ) ahead
+    ), m.total
+    from mine m
+    where m.total > 0;
+$$;
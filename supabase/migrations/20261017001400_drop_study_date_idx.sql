@@ -0,0 +1,3 @@
+-- 週間ランキングは daily_study_totals を読むようになり (20261017000900)、study_logs を日付だけで絞る検索はなくなったため、
+-- 書き込みのたびに更新コストだけがかかる study_logs_study_date_idx は削除する
+drop index if exists study_logs_study_date_idx;
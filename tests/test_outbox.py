@@ -0,0 +1,141 @@
+"""outbox.Outbox の送信・再送・冪等性のテスト (送信先は bench のメモリ上の Supabase)。"""
+import sqlite3
+import warnings
+
+import pytest
+
+import outbox
+from bench.fake_supabase import FakeSupabase
+
+
+class Server:
+    """log_study_batch を FakeSupabase に送る send。fail / lose で失敗のしかたを切り替える。"""
+
+    def __init__(self):
+        self.db = FakeSupabase()
+        self.db.seed("users", [{"username": "u", "xp": 0, "coins": 0, "daily_goal": 60}])
+        self.calls = []
+        self.fail = None   # 送る前に投げる例外 (接続エラー)
+        self.lose = False  # 登録した後で応答が失われる
+
+    def __call__(self, username, entries):
+        self.calls.append([e["client_id"] for e in entries])
+        if self.fail: raise self.fail
+        out = self.db.rpc("log_study_batch", {"p_username": username, "p_entries": entries}).execute().data
+        if self.lose: raise TimeoutError("response lost")
+        return out
+
+    def logs(self): return self.db.tables["study_logs"]
+
+
+@pytest.fixture
+def server(): return Server()
+
+
+@pytest.fixture
+def box(tmp_path, server): return outbox.Outbox(str(tmp_path / "outbox.sqlite3"), server)
+
+
+def enqueue(box, username="u", minutes=30):
+    return box.enqueue(username, "数学", minutes, "2026-10-17", "2026-10-17")
+
+
+def make_due(box):
+    # バックオフの待ち時間を飛ばす
+    with box._connect() as db: db.execute("update pending_logs set next_at = 0")
+
+
+def test_flush_sends_and_removes_rows(box, server):
+    ids = {enqueue(box), enqueue(box)}
+    assert box.flush() == 2
+    assert set(server.calls[0]) == ids
+    assert box.pending("u") == [] and len(server.logs()) == 2
+    assert box.generation("u") == 1
+    assert box.pop_notices("u")[0]["user"]["xp"] == 60
+
+
+def test_flush_batches_per_user(box, server, monkeypatch):
+    monkeypatch.setattr(outbox, "BATCH_SIZE", 2)
+    for _ in range(5): enqueue(box)
+    assert box.flush() == 5
+    assert [len(c) for c in server.calls] == [2, 2, 1]
+
+
+def test_send_error_keeps_rows_with_backoff(box, server):
+    cid = enqueue(box)
+    server.fail = ConnectionError("offline")
+    assert box.flush() == 0
+    row, = box.pending("u")
+    assert row["attempts"] == 1 and row["next_at"] > 0 and "offline" in row["last_error"]
+    # 待ち時間中は送らない
+    assert box.flush() == 0 and len(server.calls) == 1
+    server.fail = None
+    make_due(box)
+    assert box.flush() == 1
+    assert server.calls[-1] == [cid] and box.pending("u") == []
+
+
+def test_lost_response_is_retried_without_duplicates(box, server):
+    enqueue(box, minutes=25)
+    server.lose = True
+    assert box.flush() == 0
+    assert len(server.logs()) == 1 and len(box.pending("u")) == 1
+    server.lose = False
+    make_due(box)
+    assert box.flush() == 1
+    # 同じ client_id で再送されるので、登録もXPも1回分のまま
+    assert server.calls[0] == server.calls[1]
+    assert len(server.logs()) == 1
+    assert server.db.tables["users"][0]["xp"] == 25
+
+
+def test_rejected_rows_are_kept_as_failed(box, server):
+    cid = enqueue(box, username="ghost")
+    assert box.flush() == 0
+    assert box.pending("ghost") == []
+    row, = box.failed("ghost")
+    assert row["client_id"] == cid and row["failed_at"] and "ok" in row["last_error"]
+    assert box.generation("ghost") == 1 and box.pop_notices("ghost") == []
+    # 拒否された行は自動では送り直さない
+    make_due(box)
+    assert box.flush() == 0 and len(server.calls) == 1
+
+
+def test_retry_failed_resends_with_same_client_id(box, server):
+    cid = enqueue(box, username="v")
+    box.flush()
+    server.db.seed("users", [{"username": "v", "xp": 0, "coins": 0, "daily_goal": 60}])
+    box.retry_failed("v")
+    assert box.failed("v") == [] and len(box.pending("v")) == 1
+    assert box.flush() == 1
+    assert server.calls[-1] == [cid]
+    assert [r["username"] for r in server.logs()] == ["v"]
+
+
+def test_discard_failed(box):
+    enqueue(box, username="ghost")
+    enqueue(box, username="u")
+    box.send = lambda username, entries: {"ok": False}
+    box.flush()
+    box.discard_failed("ghost")
+    assert box.failed("ghost") == [] and len(box.failed("u")) == 1
+
+
+def test_connections_are_closed(box):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", ResourceWarning)
+        enqueue(box)
+        box.pending("u")
+        box.flush()
+    with box._connect() as db: pass
+    with pytest.raises(sqlite3.ProgrammingError): db.execute("select 1")
+
+
+def test_adds_failed_at_to_existing_file(tmp_path, server):
+    path = str(tmp_path / "old.sqlite3")
+    with sqlite3.connect(path) as db:
+        db.executescript(outbox._SCHEMA.replace(",\n    failed_at real", ""))
+    db.close()
+    box = outbox.Outbox(path, server)
+    enqueue(box)
+    assert box.flush() == 1